@@ -0,0 +1,168 @@
+
+import os, sys, json, time, shutil, platform, tempfile, argparse, importlib.util
+import numpy as np
+from typing import Callable, Dict, List
+from monolayer_cell_tracking.video import Video
+from .synthetic import SyntheticMonolayer, SyntheticVisualization
+
+# Monolayers of increasing size, with a roughly constant cell diameter (of ~25 pixels).
+SCALES: Dict[str, Dict] = {
+  'small': {'num_cells': 100, 'size': 256, 'num_frames': 8},
+  'medium': {'num_cells': 400, 'size': 512, 'num_frames': 8},
+  'large': {'num_cells': 1600, 'size': 1024, 'num_frames': 8}}
+
+# `shared_edge()` compares every pair of contour points, so only this many cell pairs per frame are timed.
+MAX_PAIRS: int = 20
+
+def time_frames(video: Video, run: Callable[[int], any], frames: List[int], setup: Callable[[int], any] = None, repeat: int = 3) -> float:
+  """ Time `run(t)` on each of the `frames` (starting from an empty cache, filled by `setup(t)`), returning the best-of-`repeat` seconds per frame. """
+  best: float = np.inf
+  for _ in range(repeat):
+    seconds: float = 0.0
+    for t in frames:
+      video.cache.clear()
+      if not isinstance(setup, type(None)):
+        setup(t)
+      start = time.perf_counter()
+      run(t)
+      seconds += time.perf_counter() - start
+    best = min(best, seconds / len(frames))
+  return best
+
+def time_dump_data(visualization: SyntheticVisualization, format: str, repeat: int = 3) -> float:
+  """ Time a full export of the trajectory data, returning the best-of-`repeat` seconds per frame. """
+  best: float = np.inf
+  for _ in range(repeat):
+    shutil.rmtree(visualization.dump_dir(), ignore_errors=True)
+    visualization.cache.clear()
+    start = time.perf_counter()
+    visualization.dump_data(format=format)
+    best = min(best, time.perf_counter() - start)
+  return best / visualization.monolayer.num_frames
+
+def contact_pairs(visualization: SyntheticVisualization, t: int) -> List[tuple]:
+  """ Find (up to `MAX_PAIRS`) pairs of cells in contact at time `t`, as pairs of contours. """
+  pairs: List[tuple] = []
+  for ii in visualization.index.cells(t).tolist():
+    for jj in visualization.neighbors(t, ii):
+      if (ii < jj) and (len(pairs) < MAX_PAIRS):
+        pairs.append((visualization.lookup_cell_contour(t, visualization.x(t, ii), visualization.y(t, ii)),
+                      visualization.lookup_cell_contour(t, visualization.x(t, jj), visualization.y(t, jj))))
+  return pairs
+
+def benchmark_scale(root: str, scale: Dict, repeat: int = 3) -> Dict:
+  """ Generate a synthetic monolayer, and time each stage of the pipeline on it. """
+  monolayer = SyntheticMonolayer(**scale)
+  (src, model_path) = monolayer.write(root)
+  visualization = SyntheticVisualization(monolayer, src, model_path)
+  frames: List[int] = list(range(monolayer.num_frames))
+  timings: Dict[str, Dict] = {}
+
+  def record(name: str, seconds: float, per: str = 'frame') -> None:
+    timings[name] = {'seconds': seconds, 'per': per}
+    print(f'  {name:<28s} {1e3 * seconds:10.3f} ms/{per}')
+
+  # Frame loading, from each frame source.
+  for frame_source in ('png', 'video', 'stack'):
+    video = Video(src, frame_source=frame_source)
+    video.extract_frames()
+    record(f'load_frame[{frame_source}]', time_frames(video, video.load_frame, frames, repeat=repeat))
+
+  # Per-frame segmentation data.
+  record('load_segmentations', time_frames(visualization, visualization.load_segmentations, frames, repeat=repeat))
+  record('compute_cell_contours', time_frames(visualization, visualization.compute_cell_contours, frames, setup=visualization.load_segmentations, repeat=repeat))
+  record('cell_contours', time_frames(visualization, visualization.cell_contours, frames, setup=visualization.load_segmentations, repeat=repeat))
+
+  def lookup_every_cell(t: int) -> None:
+    for ii in visualization.index.cells(t).tolist():
+      visualization.lookup_cell_contour(t, visualization.x(t, ii), visualization.y(t, ii))
+  record('lookup_cell_contour', time_frames(visualization, lookup_every_cell, frames, setup=visualization.label_table, repeat=repeat))
+
+  def neighbors_of_every_cell(t: int) -> None:
+    for ii in visualization.index.cells(t).tolist():
+      visualization.neighbors(t, ii)
+  record('neighbors', time_frames(visualization, neighbors_of_every_cell, frames, setup=visualization.load_segmentations, repeat=repeat))
+
+  pairs: Dict[int, List[tuple]] = {}
+  def shared_edge_of_pairs(t: int) -> None:
+    for (cell_1, cell_2) in pairs[t]:
+      visualization.shared_edge(cell_1, cell_2)
+  seconds: float = time_frames(visualization, shared_edge_of_pairs, frames, setup=lambda t: pairs.__setitem__(t, contact_pairs(visualization, t)), repeat=repeat)
+  record('shared_edge', seconds * monolayer.num_frames / max(sum(len(p) for p in pairs.values()), 1), per='pair')
+
+  # Export of the trajectory data.
+  record('dump_data[csv]', time_dump_data(visualization, 'csv', repeat=repeat))
+  if not isinstance(importlib.util.find_spec('pyarrow'), type(None)):
+    record('dump_data[parquet]', time_dump_data(visualization, 'parquet', repeat=repeat))
+
+  # Rendering of the visualization overlays.
+  record('overlay_segmentations', time_frames(visualization, visualization.overlay_segmentations, frames, setup=visualization.load_frame, repeat=repeat))
+  overlays: Dict[int, np.ndarray] = {}
+  def overlay_frame(t: int) -> None:
+    overlays[t] = visualization.overlay_segmentations(t)
+  record('highlight_shared_edges', time_frames(visualization, lambda t: visualization.highlight_shared_edges(overlays[t], t, None), frames, setup=overlay_frame, repeat=repeat))
+  record('contact_points_frame', time_frames(visualization, lambda t: visualization.contact_points_frame(t, None), frames, setup=visualization.load_frame, repeat=repeat))
+
+  return {'parameters': monolayer.parameters(), 'timings': timings}
+
+def compare(results: Dict, baseline: Dict, tolerance: float = 0.25) -> List[str]:
+  """ Find the benchmarks that are more than `tolerance` (fractionally) slower than in the baseline results. """
+  regressions: List[str] = []
+  for scale, result in results['scales'].items():
+    baseline_result: Dict = baseline['scales'].get(scale)
+    if isinstance(baseline_result, type(None)) or (baseline_result['parameters'] != result['parameters']):
+      continue
+    for name, timing in result['timings'].items():
+      baseline_timing: Dict = baseline_result['timings'].get(name)
+      if isinstance(baseline_timing, type(None)):
+        continue
+      ratio: float = timing['seconds'] / max(baseline_timing['seconds'], 1e-9)
+      if ((1.0 + tolerance) < ratio):
+        regressions.append(f'{scale}/{name}: {1e3 * timing["seconds"]:.3f} ms/{timing["per"]} is {ratio:.2f}x the baseline ({1e3 * baseline_timing["seconds"]:.3f} ms/{timing["per"]})')
+  return regressions
+
+def main(scales: List[str], repeat: int = 3, workdir: str = None, output: str = None, baseline: str = None, tolerance: float = 0.25) -> int:
+  root: str = workdir or tempfile.mkdtemp(prefix='monolayer_benchmarks_')
+  results: Dict = {
+    'environment': {
+      'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(), 'processor': platform.processor(),
+      'platform': platform.platform(), 'cpus': os.cpu_count()},
+    'repeat': repeat,
+    'scales': {}}
+  try:
+    for scale in scales:
+      print(f'{scale}: {SCALES[scale]}')
+      scale_dir = os.path.join(root, scale)
+      os.makedirs(scale_dir, exist_ok=True)
+      results['scales'][scale] = benchmark_scale(scale_dir, SCALES[scale], repeat)
+  finally:
+    if isinstance(workdir, type(None)):
+      shutil.rmtree(root)
+
+  if output:
+    with open(output, 'w') as f:
+      json.dump(results, f, indent=2)
+
+  if baseline:
+    with open(baseline) as f:
+      baseline_results: Dict = json.load(f)
+    # Timings are only comparable on the same machine (e.g. the committed baseline was measured elsewhere).
+    if baseline_results.get('environment') != results['environment']:
+      print(f'WARNING {baseline} was measured in a different environment: {baseline_results.get("environment")}')
+    regressions: List[str] = compare(results, baseline_results, tolerance)
+    for regression in regressions:
+      print(f'REGRESSION {regression}')
+    print(f'{len(regressions)} regression(s) against {baseline} (tolerance {100 * tolerance:.0f}%)')
+    return 1 if regressions else 0
+  return 0
+
+if __name__=="__main__":
+  parser = argparse.ArgumentParser(description='Time each stage of the pipeline on synthetic monolayers (no segmentation model or network access needed).')
+  parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=['small', 'medium'])
+  parser.add_argument('--repeat', type=int, default=3, help='number of timing runs, of which the fastest is reported')
+  parser.add_argument('--workdir', default=None, help='directory to write the synthetic movies to (a temporary directory by default)')
+  parser.add_argument('--output', default=None, help='json file to save the results to')
+  parser.add_argument('--baseline', default=None, help='json results of an earlier run, to check for regressions against')
+  parser.add_argument('--tolerance', type=float, default=0.25, help='fractional slowdown (relative to the baseline) counted as a regression')
+  args = parser.parse_args()
+  sys.exit(main(args.scales, args.repeat, args.workdir, args.output, args.baseline, args.tolerance))
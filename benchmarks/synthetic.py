@@ -0,0 +1,131 @@
+
+import os, cv2
+import numpy as np
+from types import SimpleNamespace
+from scipy.spatial import cKDTree
+from typing import Dict, List, Tuple
+from monolayer_cell_tracking.visualization import Visualization
+from monolayer_cell_tracking.manifest import digest
+
+class SyntheticTracklet():
+  def __init__(self, t: List[int], x: List[float], y: List[float], properties: Dict[str, np.ndarray]) -> None:
+    """ This class holds a ground-truth cell trajectory, with the same fields as the tracklets returned by btrack. """
+    self.t: List[int] = t
+    self.x: List[float] = x
+    self.y: List[float] = y
+    self.properties: Dict[str, np.ndarray] = properties
+
+class SyntheticMonolayer():
+  def __init__(self, num_cells: int = 100, size: int = 256, num_frames: int = 8, drift: Tuple[float, float] = (0.5, 0.25), motility: float = 0.5, seed: int = 0) -> None:
+    """ This class generates a confluent monolayer as a Voronoi tiling of drifting cell centers, separated by 1 pixel wide membranes. """
+    self.num_cells: int = num_cells
+    self.size: int = size
+    self.num_frames: int = num_frames
+    self.drift: Tuple[float, float] = drift
+    self.motility: float = motility
+    self.seed: int = seed
+
+    # Each cell moves with the collective `drift` (in pixels per frame), plus a random walk of step size `motility`.
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(0.0, motility, (num_frames, num_cells, 2)) + np.array(drift)
+    steps[0] = rng.uniform(0, size, (num_cells, 2))
+    self.centers: np.ndarray = self.reflect(np.cumsum(steps, axis=0))
+    self.colors: np.ndarray = rng.integers(64, 256, (num_cells + 1, 3), dtype=np.uint8)
+    self.colors[0] = (16, 16, 16)
+
+  def parameters(self) -> Dict[str, any]:
+    """ The settings that the monolayer was generated from. """
+    return {
+      'num_cells': self.num_cells,
+      'size': self.size,
+      'num_frames': self.num_frames,
+      'drift': list(self.drift),
+      'motility': self.motility,
+      'seed': self.seed}
+
+  def cell_diameter(self) -> float:
+    """ The typical diameter of a cell. """
+    return 2 * np.sqrt(self.size**2 / (np.pi * self.num_cells))
+
+  def reflect(self, points: np.ndarray) -> np.ndarray:
+    """ Keep points inside the frame, by reflecting them off its edges. """
+    period = 2 * (self.size - 1)
+    return (self.size - 1) - np.abs((self.size - 1) - np.mod(points, period))
+
+  def masks(self, t: int) -> np.ndarray:
+    """ Return the (ground-truth) segmentation masks at time `t`; cell `ii` is labelled `ii+1`, and the membranes are background. """
+    (yy, xx) = np.mgrid[0:self.size, 0:self.size]
+    (d, kk) = cKDTree(self.centers[t][:, ::-1]).query(np.c_[yy.ravel(), xx.ravel()], k=2)
+    masks = (kk[:, 0] + 1).astype(np.uint16)
+    masks[(d[:, 1] - d[:, 0]) < 1.0] = 0
+    return masks.reshape(self.size, self.size)
+
+  def frame(self, t: int, masks: np.ndarray) -> np.ndarray:
+    """ Render the (rgb) video frame at time `t`, by coloring each cell and adding some noise. """
+    noise = np.random.default_rng((self.seed, t)).normal(0, 8, masks.shape + (3,))
+    return np.clip(self.colors[masks] + noise, 0, 255).astype(np.uint8)
+
+  def tracklets(self, masks: List[np.ndarray]) -> List[SyntheticTracklet]:
+    """ Measure the centroid, area and shape of every cell in every frame, from the ground-truth masks. """
+    n = self.num_cells + 1
+    data: Dict[str, List[np.ndarray]] = {'x': [], 'y': [], 'area': [], 'major_axis_length': [], 'minor_axis_length': [], 'orientation': []}
+    for masks_t in masks:
+      (yy, xx) = np.mgrid[0:masks_t.shape[0], 0:masks_t.shape[1]]
+      (labels, yy, xx) = (masks_t.ravel(), yy.ravel().astype(float), xx.ravel().astype(float))
+      area = np.maximum(np.bincount(labels, minlength=n), 1)
+      (x, y) = (np.bincount(labels, xx, n) / area, np.bincount(labels, yy, n) / area)
+
+      # Central second moments of each cell, from which its ellipse axes and orientation follow (as in `skimage.measure.regionprops`).
+      mu_xx = np.bincount(labels, xx**2, n) / area - x**2
+      mu_yy = np.bincount(labels, yy**2, n) / area - y**2
+      mu_xy = np.bincount(labels, xx * yy, n) / area - x * y
+      root = np.sqrt(((mu_xx - mu_yy) / 2)**2 + mu_xy**2)
+      for name, value in (('x', x), ('y', y), ('area', area),
+                          ('major_axis_length', 4 * np.sqrt(np.maximum((mu_xx + mu_yy) / 2 + root, 0))),
+                          ('minor_axis_length', 4 * np.sqrt(np.maximum((mu_xx + mu_yy) / 2 - root, 0))),
+                          ('orientation', 0.5 * np.arctan2(-2 * mu_xy, mu_xx - mu_yy))):
+        data[name].append(value[1:])
+
+    data: Dict[str, np.ndarray] = {name: np.stack(values, axis=1) for name, values in data.items()}
+    frames: List[int] = list(range(self.num_frames))
+    return [SyntheticTracklet(
+      frames,
+      data['x'][ii].tolist(),
+      data['y'][ii].tolist(),
+      {name: data[name][ii] for name in ('area', 'major_axis_length', 'minor_axis_length', 'orientation')})
+      for ii in range(self.num_cells)]
+
+  def write(self, dst_dir: str, name: str = 'monolayer') -> Tuple[str, str]:
+    """ Save the movie (as an mp4 file) and a stand-in for the segmentation model's weights; returns their paths. """
+    src = os.path.join(dst_dir, f'{name}.mp4')
+    model_path = os.path.join(dst_dir, f'{name}_model')
+    video = cv2.VideoWriter(src, cv2.VideoWriter_fourcc(*'mp4v'), 10, (self.size, self.size))
+    for t in range(self.num_frames):
+      video.write(cv2.cvtColor(self.frame(t, self.masks(t)), cv2.COLOR_RGB2BGR))
+    video.release()
+    with open(model_path, 'w') as f:
+      f.write(repr(self.parameters()))
+    return src, model_path
+
+class SyntheticVisualization(Visualization):
+  def __init__(self, monolayer: SyntheticMonolayer, src: str, model_path: str, **kwargs) -> None:
+    """ This class runs the pipeline on a synthetic monolayer, with its ground-truth masks and trajectories in place of cellpose and btrack. """
+    self.monolayer: SyntheticMonolayer = monolayer
+    Visualization.__init__(self, src, model_path, **kwargs)
+    self.extract_frames()
+
+    # The ground-truth masks are saved as the segmentations (once per frame and model, as with real segmentations).
+    frames: List[int] = [t for t in range(self.monolayer.num_frames) if not self.is_segmented(t)]
+    self.save_segmentations(frames, [self.monolayer.masks(t) for t in frames])
+
+  def load_segmentation_model(self, model_path: str) -> any:
+    """ There is no segmentation model to load, only the typical cell diameter it would have been trained on. """
+    return SimpleNamespace(diam_labels=np.array(self.monolayer.cell_diameter()))
+
+  def extract_trajectories(self) -> List[SyntheticTracklet]:
+    """ The trajectories are known exactly, so there is nothing to track. """
+    return self.monolayer.tracklets([self.monolayer.masks(t) for t in range(self.monolayer.num_frames)])
+
+  def trajectories_digest(self) -> str:
+    """ Hash the settings that the trajectories were generated from. """
+    return digest(self.monolayer.parameters())
@@ -0,0 +1,80 @@
+
+import sys, mmap, threading
+import numpy as np
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable
+
+class LRUCache():
+  def __init__(self, max_bytes: int) -> None:
+    """ This class keeps recently used data in memory, evicting the least recently used entries once `max_bytes` is exceeded. """
+    self.max_bytes: int = max_bytes
+    self.entries: OrderedDict = OrderedDict()
+    self.nbytes: int = 0
+    self.hits: int = 0
+    self.misses: int = 0
+
+    # The cache is shared with background threads (e.g. the segmentation prefetcher), so its bookkeeping is done under a lock.
+    self.lock = threading.Lock()
+
+    # Hit and miss counts for each kind of entry (the first element of tuple keys, e.g. 'frame' or 'masks').
+    self.kinds: Dict[Hashable, Dict[str, int]] = {}
+
+  def size_of(self, value: any) -> int:
+    """ Estimate the memory footprint of a cached value (memory-mapped arrays are free, since their data lives on disk). """
+    if isinstance(value, np.ndarray):
+      base = value
+      while isinstance(base, np.ndarray) and not isinstance(base.base, type(None)):
+        base = base.base
+      return 0 if isinstance(base, mmap.mmap) else value.nbytes
+    elif isinstance(value, dict):
+      return sys.getsizeof(value) + sum(self.size_of(k) + self.size_of(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+      return sys.getsizeof(value) + sum(self.size_of(v) for v in value)
+    elif hasattr(value, '__dict__'):
+      return sys.getsizeof(value) + self.size_of(vars(value))
+    return sys.getsizeof(value)
+
+  def get(self, key: Hashable, compute: Callable[[], any]) -> any:
+    """ Return the value cached under `key`, computing (and caching) it on a miss. """
+    with self.lock:
+      kind = self.kinds.setdefault(key[0] if isinstance(key, tuple) else key, {'hits': 0, 'misses': 0})
+      if key in self.entries:
+        self.hits += 1
+        kind['hits'] += 1
+        self.entries.move_to_end(key)
+        return self.entries[key][0]
+      self.misses += 1
+      kind['misses'] += 1
+
+    # The value is computed outside the lock, since computing it may itself read from the cache (or take a while).
+    value = compute()
+    nbytes: int = self.size_of(value)
+    with self.lock:
+      if key in self.entries:
+        # Another thread computed the same value in the meantime, so its entry is replaced.
+        self.nbytes -= self.entries.pop(key)[1]
+      self.entries[key] = (value, nbytes)
+      self.nbytes += nbytes
+      while (self.max_bytes < self.nbytes) and (1 < len(self.entries)):
+        (_, evicted_nbytes) = self.entries.popitem(last=False)[1]
+        self.nbytes -= evicted_nbytes
+    return value
+
+  def clear(self) -> None:
+    """ Remove every entry from the cache (the hit and miss counters are kept). """
+    with self.lock:
+      self.entries.clear()
+      self.nbytes = 0
+
+  def stats(self) -> Dict[str, any]:
+    """ Summarize the cache's usage. """
+    with self.lock:
+      lookups = self.hits + self.misses
+      return {
+        'entries': len(self.entries),
+        'nbytes': self.nbytes,
+        'max_bytes': self.max_bytes,
+        'hits': self.hits,
+        'misses': self.misses,
+        'hit_rate': (self.hits / lookups) if lookups else 0.0,
+        'kinds': {str(name): {**kind, 'hit_rate': kind['hits'] / (kind['hits'] + kind['misses'])} for name, kind in self.kinds.items()}}
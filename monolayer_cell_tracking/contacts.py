@@ -0,0 +1,96 @@
+
+import numpy as np
+from typing import Dict, List, Tuple
+from .files import atomic_write
+
+class ContactGraph():
+  def __init__(self, t: np.ndarray, ii: np.ndarray, jj: np.ndarray, num_contact_pnts: np.ndarray, num_frames: int, num_cells: int) -> None:
+    """ This class stores which cells are in contact (and along how many shared edge points) in every frame, in tracklet-id space. """
+    self.num_frames: int = num_frames
+    self.num_cells: int = num_cells
+
+    # Each contact is stored in both directions, sorted by (t, ii, jj); so each frame's contacts form a compressed sparse row graph.
+    order = np.lexsort((jj, ii, t))
+    self.t: np.ndarray = np.asarray(t, dtype=np.int64)[order]
+    self.ii: np.ndarray = np.asarray(ii, dtype=np.int64)[order]
+    self.jj: np.ndarray = np.asarray(jj, dtype=np.int64)[order]
+    self.num_contact_pnts: np.ndarray = np.asarray(num_contact_pnts, dtype=np.int64)[order]
+    self.frame_start: np.ndarray = np.searchsorted(self.t, np.arange(num_frames + 1))
+
+    # The same contacts ordered by (ii, t, jj), so that the contact history of a cell is one contiguous block.
+    self.cell_order: np.ndarray = np.lexsort((self.jj, self.t, self.ii))
+    self.cell_start: np.ndarray = np.searchsorted(self.ii[self.cell_order], np.arange(num_cells + 1))
+
+  def num_contacts(self) -> int:
+    """ Total number of (directed) contacts, over every frame. """
+    return len(self.t)
+
+  def frame_contacts(self, t: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ Return the (ii, jj, num_contact_pnts) arrays of every contact at time `t`. """
+    if not (0 <= t < self.num_frames):
+      return (np.zeros(0, dtype=np.int64),) * 3
+    (a, b) = (self.frame_start[t], self.frame_start[t+1])
+    return self.ii[a:b], self.jj[a:b], self.num_contact_pnts[a:b]
+
+  def contacts(self, t: int, ii: int) -> Dict[int, int]:
+    """ Map each cell in contact with cell `ii` at time `t` to the number of points along their shared edge. """
+    (cells, neighbors, num_contact_pnts) = self.frame_contacts(t)
+    (a, b) = (np.searchsorted(cells, ii, 'left'), np.searchsorted(cells, ii, 'right'))
+    return dict(zip(neighbors[a:b].tolist(), num_contact_pnts[a:b].tolist()))
+
+  def neighbors(self, t: int, ii: int) -> np.ndarray:
+    """ Return the (sorted) cells in contact with cell `ii` at time `t`. """
+    (cells, neighbors, _) = self.frame_contacts(t)
+    return neighbors[np.searchsorted(cells, ii, 'left'):np.searchsorted(cells, ii, 'right')]
+
+  def history(self, ii: int, t0: int = 0, tf: int = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ Return the (t, jj, num_contact_pnts) arrays of every contact of cell `ii` at times t0 <= t <= tf (ordered by time). """
+    rows = self.cell_order[self.cell_start[ii]:self.cell_start[ii+1]]
+    tf = (self.num_frames - 1) if isinstance(tf, type(None)) else tf
+    rows = rows[np.searchsorted(self.t[rows], t0, 'left'):np.searchsorted(self.t[rows], tf, 'right')]
+    return self.t[rows], self.jj[rows], self.num_contact_pnts[rows]
+
+  def neighbors_between(self, ii: int, t0: int = 0, tf: int = None) -> np.ndarray:
+    """ Return the (sorted) cells that are in contact with cell `ii` at any time t0 <= t <= tf. """
+    return np.unique(self.history(ii, t0, tf)[1])
+
+  def contact_frames(self, ii: int, jj: int) -> np.ndarray:
+    """ Return the times at which cells `ii` and `jj` are in contact. """
+    (t, neighbors, _) = self.history(ii)
+    return t[neighbors == jj]
+
+  def t1_events(self, t0: int = 0, tf: int = None) -> np.ndarray:
+    """ Find the neighbor exchanges (T1 transitions) between frames t0 <= t < t+1 <= tf, as rows of (t, a, b, c, d). """
+    # Cells `a` and `b` lose contact between `t` and `t+1`, while two of their common neighbors, `c` and `d`, come into contact
+    # (and both stay in contact with `a` and `b`).
+    tf = (self.num_frames - 1) if isinstance(tf, type(None)) else tf
+    events = []
+    for t in range(t0, tf):
+      (lost, gained) = self.edge_changes(t)
+      for (a, b) in lost:
+        common = np.intersect1d(self.neighbors(t, a), self.neighbors(t, b))
+        for (c, d) in gained:
+          if (c in common) and (d in common) and np.all(np.isin((a, b), np.intersect1d(self.neighbors(t+1, c), self.neighbors(t+1, d)))):
+            events.append((t, a, b, c, d))
+    return np.array(events, dtype=np.int64).reshape(-1, 5)
+
+  def edge_changes(self, t: int) -> Tuple[List[List[int]], List[List[int]]]:
+    """ Return the (a, b) pairs of cells (with a < b) that lose contact between times `t` and `t+1`, and those that come into contact. """
+    keys = []
+    for tt in (t, t + 1):
+      (cells, neighbors, _) = self.frame_contacts(tt)
+      keys.append((cells * self.num_cells + neighbors)[cells < neighbors])
+    lost = np.setdiff1d(keys[0], keys[1])
+    gained = np.setdiff1d(keys[1], keys[0])
+    return np.stack(np.divmod(lost, self.num_cells), axis=1).tolist(), np.stack(np.divmod(gained, self.num_cells), axis=1).tolist()
+
+  def save(self, path: str) -> None:
+    """ Save the contact graph to a (compressed) numpy file. """
+    with atomic_write(path) as tmp_path, open(tmp_path, 'wb') as f:
+      np.savez_compressed(f, t=self.t, ii=self.ii, jj=self.jj, num_contact_pnts=self.num_contact_pnts, shape=np.array([self.num_frames, self.num_cells]))
+
+def load_contact_graph(path: str) -> ContactGraph:
+  """ Load a contact graph saved by `ContactGraph.save()`. """
+  with np.load(path) as npz_file:
+    (num_frames, num_cells) = npz_file['shape'].tolist()
+    return ContactGraph(npz_file['t'], npz_file['ii'], npz_file['jj'], npz_file['num_contact_pnts'], num_frames, num_cells)
@@ -0,0 +1,89 @@
+
+import cv2
+import numpy as np
+from scipy import ndimage
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Tuple
+from .files import atomic_write
+
+class CellContours(Mapping):
+  def __init__(self, labels: np.ndarray, offsets: np.ndarray, coords: np.ndarray) -> None:
+    """ This class packs the outline of every cell in a frame into one (x,y) coordinate array, indexed by segmentation label. """
+    # The outline of `labels[kk]` is `coords[offsets[kk]:offsets[kk+1]]` (labels are sorted).
+    self.labels: np.ndarray = np.asarray(labels, dtype=np.int64)
+    self.offsets: np.ndarray = np.asarray(offsets, dtype=np.int64)
+    self.coords: np.ndarray = np.asarray(coords, dtype=np.int32).reshape(-1, 2)
+
+    # Each outline's number of points (the cell's perimeter), and its (y0, y1, x0, x1) bounding box.
+    self.perimeters: np.ndarray = np.diff(self.offsets)
+    self.bboxes: np.ndarray = np.zeros((len(self.labels), 4), dtype=np.int64)
+    nonempty = np.flatnonzero(0 < self.perimeters)
+    if len(nonempty):
+      starts = self.offsets[nonempty]
+      (x, y) = (self.coords[:, 0], self.coords[:, 1])
+      self.bboxes[nonempty] = np.stack((
+        np.minimum.reduceat(y, starts), np.maximum.reduceat(y, starts) + 1,
+        np.minimum.reduceat(x, starts), np.maximum.reduceat(x, starts) + 1), axis=1)
+    for array in (self.labels, self.offsets, self.coords, self.perimeters, self.bboxes):
+      array.flags.writeable = False
+
+  def index(self, label: int) -> int:
+    """ Return the position of `label` in the packed arrays (raises a KeyError if it has no outline). """
+    kk = int(np.searchsorted(self.labels, label))
+    if (kk == len(self.labels)) or (self.labels[kk] != label):
+      raise KeyError(label)
+    return kk
+
+  def __getitem__(self, label: int) -> Dict:
+    """ Return the outline of `label`, as (zero-copy) views of its x and y coordinates, along with its bounding box. """
+    kk = self.index(label)
+    outline = self.coords[self.offsets[kk]:self.offsets[kk+1]]
+    return {'x': outline[:, 0], 'y': outline[:, 1], 'label': int(label), 'bbox': tuple(self.bboxes[kk].tolist())}
+
+  def __iter__(self) -> Iterator[int]:
+    return iter(self.labels.tolist())
+
+  def __len__(self) -> int:
+    return len(self.labels)
+
+  def perimeter(self, label: int) -> int:
+    """ Return the number of points along the outline of `label`. """
+    return int(self.perimeters[self.index(label)])
+
+  def bbox(self, label: int) -> Tuple[int, int, int, int]:
+    """ Return the (y0, y1, x0, x1) bounding box of the outline of `label`. """
+    return tuple(self.bboxes[self.index(label)].tolist())
+
+  def save(self, path: str) -> None:
+    """ Save the packed outlines to a (uncompressed) numpy file. """
+    with atomic_write(path) as tmp_path, open(tmp_path, 'wb') as f:
+      np.savez(f, labels=self.labels, offsets=self.offsets, coords=self.coords)
+
+def pack_outlines(labels: List[int], outlines: List[np.ndarray]) -> CellContours:
+  """ Pack a list of (k,2) outline arrays of (x,y) coordinates, one per label in `labels`, into a CellContours. """
+  order = np.argsort(np.asarray(labels, dtype=np.int64), kind='stable')
+  outlines = [np.asarray(outlines[kk], dtype=np.int32).reshape(-1, 2) for kk in order.tolist()]
+  offsets = np.concatenate(([0], np.cumsum([len(outline) for outline in outlines], dtype=np.int64)))
+  coords = np.concatenate(outlines) if outlines else np.zeros((0, 2), dtype=np.int32)
+  return CellContours(np.asarray(labels, dtype=np.int64)[order], offsets, coords)
+
+def load_contours(path: str) -> CellContours:
+  """ Load packed outlines saved by `CellContours.save()`. """
+  with np.load(path) as npz_file:
+    return CellContours(npz_file['labels'], npz_file['offsets'], npz_file['coords'])
+
+def trace_outlines(masks: np.ndarray) -> CellContours:
+  """ Trace the outline of every label in `masks`, one bounding-box crop at a time (with the same output as cellpose's `utils.outlines_list()`). """
+  # As in `outlines_list()`, the smallest label is taken to be the background (even if it is not 0).
+  labels: np.ndarray = np.unique(masks)[1:]
+  slices: List[Tuple[slice, slice]] = ndimage.find_objects(masks)
+  outlines: List[np.ndarray] = []
+  for label in labels.tolist():
+    # Pad the crop by 1 pixel, so that outlines along the edge of the crop are traced as they would be in the whole frame.
+    (ys, xs) = slices[label - 1]
+    crop = np.pad((masks[ys, xs] == label).astype(np.uint8), 1)
+    contours = cv2.findContours(crop, mode=cv2.RETR_EXTERNAL, method=cv2.CHAIN_APPROX_NONE)[-2]
+    # Only the longest outline of each label is kept, and outlines of 4 points or fewer are left empty.
+    outline = contours[int(np.argmax([len(contour) for contour in contours]))].reshape(-1, 2)
+    outlines.append((outline + (xs.start - 1, ys.start - 1)) if (4 < len(outline)) else np.zeros((0, 2), dtype=np.int32))
+  return pack_outlines(labels, outlines)
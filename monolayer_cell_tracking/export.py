@@ -0,0 +1,99 @@
+
+import os
+import numpy as np
+from typing import Dict, List
+from .files import temporary_path
+
+# Columns of the per-cell-per-frame table, and of the (long-format) cell-cell contact table.
+CELL_COLUMNS: Dict[str, str] = {
+  't': 'int64', 'ii': 'int64', 'x': 'int64', 'y': 'int64', 'A': 'int64', 'l1': 'int64', 'l2': 'int64',
+  'theta': 'float64', 'P': 'int64', 'c1': 'int64', 'c2': 'int64', 'c3': 'int64'}
+NEIGHBOR_COLUMNS: Dict[str, str] = {'t': 'int64', 'ii': 'int64', 'jj': 'int64', 'num_contact_pnts': 'int64'}
+
+def import_pyarrow() -> any:
+  """ Columnar export relies on the optional pyarrow dependency, which is only imported once it is needed. """
+  try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+  except ImportError as error:
+    raise ImportError('Columnar export requires pyarrow (pip install "monolayer-cell-tracking[columnar]").') from error
+  return pyarrow
+
+class TableWriter():
+  def __init__(self, path: str, columns: Dict[str, str], format: str = 'parquet') -> None:
+    """ This class streams batches of rows to a single Parquet or Feather file, one row group (or record batch) per batch. """
+    assert format in ('parquet', 'feather')
+    pa = import_pyarrow()
+    self.path: str = path
+    self.schema = pa.schema([(name, pa.from_numpy_dtype(np.dtype(dtype))) for name, dtype in columns.items()])
+
+    self.tmp_path: str = temporary_path(path)
+    if (format == 'parquet'):
+      self.writer = pa.parquet.ParquetWriter(self.tmp_path, self.schema)
+    else:
+      self.writer = pa.ipc.new_file(self.tmp_path, self.schema)
+
+  def write(self, columns: Dict[str, List]) -> None:
+    """ Append a batch of rows, given as one list of values per column. """
+    pa = import_pyarrow()
+    self.writer.write_table(pa.Table.from_pydict(columns, schema=self.schema))
+
+  def close(self) -> None:
+    """ Finish writing the file, and move it into place. """
+    self.writer.close()
+    os.replace(self.tmp_path, self.path)
+
+def write_table(path: str, columns: Dict[str, str], table: Dict[str, np.ndarray], format: str = 'parquet', rows_per_row_group: int = 2**20) -> None:
+  """ Save a table held as one array per column to a Parquet or Feather file, `rows_per_row_group` rows at a time. """
+  writer = TableWriter(path, columns, format)
+  num_rows: int = len(next(iter(table.values()))) if table else 0
+  for start in range(0, num_rows, rows_per_row_group):
+    writer.write({name: table[name][start:start + rows_per_row_group] for name in columns})
+  writer.close()
+
+class ColumnarExport():
+  def __init__(self, dst_dir: str, format: str = 'parquet', frames_per_row_group: int = 64) -> None:
+    """ This class saves trajectory data to a cell table and a neighbor table, buffering `frames_per_row_group` frames per row group. """
+    self.cells_file: str = os.path.join(dst_dir, f'cells.{format}')
+    self.neighbors_file: str = os.path.join(dst_dir, f'neighbors.{format}')
+    self.cells = TableWriter(self.cells_file, CELL_COLUMNS, format)
+    self.neighbors = TableWriter(self.neighbors_file, NEIGHBOR_COLUMNS, format)
+    self.frames_per_row_group: int = frames_per_row_group
+    self.num_buffered_frames: int = 0
+    self.clear_buffers()
+
+  def clear_buffers(self) -> None:
+    """ Start a new (empty) row group for each table. """
+    self.cell_buffer: Dict[str, List] = {name: [] for name in CELL_COLUMNS}
+    self.neighbor_buffer: Dict[str, List] = {name: [] for name in NEIGHBOR_COLUMNS}
+    self.num_buffered_frames = 0
+
+  def add_frame(self, t: int, rows: Dict[int, Dict]) -> None:
+    """ Buffer the trajectory data of each cell at time `t` (as returned by `Trajectories.frame_data()`). """
+    for ii, row in rows.items():
+      self.cell_buffer['ii'].append(ii)
+      for name in CELL_COLUMNS:
+        if (name != 'ii'):
+          self.cell_buffer[name].append(row[name])
+      for jj, num_contact_pnts in row['contacts']:
+        self.neighbor_buffer['t'].append(t)
+        self.neighbor_buffer['ii'].append(ii)
+        self.neighbor_buffer['jj'].append(jj)
+        self.neighbor_buffer['num_contact_pnts'].append(num_contact_pnts)
+    self.num_buffered_frames += 1
+    if (self.frames_per_row_group <= self.num_buffered_frames):
+      self.flush()
+
+  def flush(self) -> None:
+    """ Write the buffered frames to disk as one row group of each table. """
+    if (0 < self.num_buffered_frames):
+      self.cells.write(self.cell_buffer)
+      self.neighbors.write(self.neighbor_buffer)
+    self.clear_buffers()
+
+  def close(self) -> None:
+    """ Write any remaining buffered frames, and finish both tables. """
+    self.flush()
+    self.cells.close()
+    self.neighbors.close()
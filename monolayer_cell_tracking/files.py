@@ -0,0 +1,29 @@
+
+import os, tempfile
+from contextlib import contextmanager
+from typing import Iterator
+
+# Temporary files are created private to the user, so they are given the permissions of ordinary new files before being moved into place.
+UMASK: int = os.umask(0)
+os.umask(UMASK)
+
+def temporary_path(path: str) -> str:
+  """ Create a uniquely named (empty) temporary file next to `path`, with the same extension, so that concurrent writers never share one. """
+  (root, ext) = os.path.splitext(path)
+  directory: str = os.path.dirname(path) or '.'
+  os.makedirs(directory, exist_ok=True)
+  with tempfile.NamedTemporaryFile(dir=directory, prefix=os.path.basename(root) + '.', suffix='.tmp' + ext, delete=False) as f:
+    os.chmod(f.name, 0o666 & ~UMASK)
+    return f.name
+
+@contextmanager
+def atomic_write(path: str) -> Iterator[str]:
+  """ Yield a temporary path to write `path` to, which is moved into place once the `with` block completes (or removed, if it fails). """
+  # An interrupted write therefore never leaves a partial file at `path`, and readers only ever see a complete file.
+  tmp_path: str = temporary_path(path)
+  try:
+    yield tmp_path
+    os.replace(tmp_path, path)
+  finally:
+    if os.path.exists(tmp_path):
+      os.remove(tmp_path)
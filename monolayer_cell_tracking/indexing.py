@@ -0,0 +1,89 @@
+
+import numpy as np
+from scipy.spatial import cKDTree
+from typing import Dict, List
+
+class TrajectoryIndex():
+  def __init__(self, trajectories: List[any], properties: List[str] = ('area', 'major_axis_length', 'minor_axis_length', 'orientation')) -> None:
+    """ This class stores the tracklets' data in flat arrays, so that it can be looked up by time and cell index in constant time. """
+    lengths = np.array([len(traj.t) for traj in trajectories], dtype=np.int64)
+
+    # Flat (row-wise) arrays holding the data of every cell at every time it exists.
+    self.t: np.ndarray = self.concatenate([traj.t for traj in trajectories], dtype=np.int64)
+    self.cell: np.ndarray = np.repeat(np.arange(len(trajectories), dtype=np.int64), lengths)
+    self.x: np.ndarray = self.concatenate([traj.x for traj in trajectories], dtype=float)
+    self.y: np.ndarray = self.concatenate([traj.y for traj in trajectories], dtype=float)
+    self.properties: Dict[str, np.ndarray] = {}
+    for name in properties:
+      self.properties[name] = self.concatenate([traj.properties.get(name, np.full(len(traj.t), np.nan)) for traj in trajectories], dtype=float)
+
+    # For each cell, a dense table mapping each time between its first and last frame to a row (-1 if it is missing).
+    row_start = np.concatenate(([0], np.cumsum(lengths)))
+    self.t_min: np.ndarray = np.array([np.min(traj.t) if len(traj.t) else 0 for traj in trajectories], dtype=np.int64)
+    self.t_max: np.ndarray = np.array([np.max(traj.t) if len(traj.t) else -1 for traj in trajectories], dtype=np.int64)
+    spans = self.t_max - self.t_min + 1
+    self.span_start: np.ndarray = np.concatenate(([0], np.cumsum(spans)))
+    self.span_rows: np.ndarray = np.full(self.span_start[-1], -1, dtype=np.int64)
+    self.span_rows[self.span_start[self.cell] + self.t - self.t_min[self.cell]] = np.arange(row_start[-1])
+
+    # For each frame, the rows of the cells that exist at that time (sorted by cell index).
+    self.frame_count: int = int(self.t.max()) + 1 if len(self.t) else 0
+    self.frame_order: np.ndarray = np.lexsort((self.cell, self.t))
+    self.frame_start: np.ndarray = np.searchsorted(self.t[self.frame_order], np.arange(self.num_frames() + 1))
+
+  def concatenate(self, arrays: List[any], dtype: type) -> np.ndarray:
+    """ Join a list of per-cell arrays into one flat array. """
+    if not arrays:
+      return np.zeros(0, dtype=dtype)
+    return np.concatenate([np.asarray(array, dtype=dtype) for array in arrays])
+
+  def num_frames(self) -> int:
+    """ Number of frames spanned by the tracklets. """
+    return self.frame_count
+
+  def row(self, t: int, ii: int) -> int:
+    """ Return the row holding the data of cell `ii` at time `t` (raises a ValueError if it does not exist then). """
+    if (t < self.t_min[ii]) or (self.t_max[ii] < t):
+      raise ValueError(f'cell {ii} does not exist at time {t}')
+    row = self.span_rows[self.span_start[ii] + t - self.t_min[ii]]
+    if (row < 0):
+      raise ValueError(f'cell {ii} does not exist at time {t}')
+    return row
+
+  def frame_rows(self, t: int) -> np.ndarray:
+    """ Return the rows of every cell that exists at time `t`. """
+    if (t < 0) or (self.num_frames() <= t):
+      return np.zeros(0, dtype=np.int64)
+    return self.frame_order[self.frame_start[t]:self.frame_start[t+1]]
+
+  def cells(self, t: int) -> np.ndarray:
+    """ Return the index of every cell that exists at time `t`. """
+    return self.cell[self.frame_rows(t)]
+
+class SpatialIndex():
+  def __init__(self, x: np.ndarray, y: np.ndarray, ids: np.ndarray, length: float = None) -> None:
+    """ This class answers radius and rectangular window queries over a set of (x,y) points labelled by `ids`. """
+    # Characteristic length-scale of the points (e.g. the average cell size), if known.
+    self.length: float = length
+    self.x: np.ndarray = np.asarray(x, dtype=float)
+    self.y: np.ndarray = np.asarray(y, dtype=float)
+    self.ids: np.ndarray = np.asarray(ids)
+    self.tree = cKDTree(np.column_stack((self.x, self.y))) if len(self.ids) else None
+
+    # Points sorted along the x-axis, so that window queries only scan a narrow strip.
+    self.x_order: np.ndarray = np.argsort(self.x, kind='stable')
+    self.x_sorted: np.ndarray = self.x[self.x_order]
+
+  def radius(self, x0: float, y0: float, r: float) -> np.ndarray:
+    """ Return the ids of the points within a distance `r` of (x0,y0), in sorted order. """
+    if isinstance(self.tree, type(None)):
+      return self.ids[:0]
+    return np.sort(self.ids[self.tree.query_ball_point((x0, y0), r)])
+
+  def window(self, y0: float, y1: float, x0: float, x1: float) -> np.ndarray:
+    """ Return the ids of the points strictly inside the window y0 < y < y1 and x0 < x < x1, in sorted order. """
+    lo = np.searchsorted(self.x_sorted, x0, side='right')
+    hi = np.searchsorted(self.x_sorted, x1, side='left')
+    strip = self.x_order[lo:hi]
+    strip = strip[(y0 < self.y[strip]) & (self.y[strip] < y1)]
+    return np.sort(self.ids[strip])
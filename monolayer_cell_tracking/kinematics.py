@@ -0,0 +1,102 @@
+
+import numpy as np
+from scipy import fft
+from typing import Dict, Iterator, Tuple
+from .indexing import TrajectoryIndex
+
+# Columns of the per-cell-per-frame velocity table, the per-lag (ensemble) correlation table, and the per-frame order table.
+VELOCITY_COLUMNS: Dict[str, str] = {'t': 'int64', 'ii': 'int64', 'vx': 'float64', 'vy': 'float64', 'speed': 'float64'}
+LAG_COLUMNS: Dict[str, str] = {'lag': 'int64', 'msd': 'float64', 'msd_pairs': 'int64', 'vacf': 'float64', 'vacf_pairs': 'int64'}
+ORDER_COLUMNS: Dict[str, str] = {'t': 'int64', 'num_cells': 'int64', 'nematic_order': 'float64', 'director': 'float64'}
+
+def cell_rows(index: TrajectoryIndex) -> np.ndarray:
+  """ Return every row of the index, ordered by cell and then by time. """
+  return np.lexsort((index.t, index.cell))
+
+def velocities(index: TrajectoryIndex) -> Dict[str, np.ndarray]:
+  """ Compute the velocity of every cell at every time it exists (in pixels per frame), ordered by cell and then by time. """
+  # Each velocity is the displacement since the cell's previous observation, divided by the frames elapsed (so gaps are bridged).
+  # The first observation of each cell has no velocity (NaN).
+  rows = cell_rows(index)
+  (t, ii, x, y) = (index.t[rows], index.cell[rows], index.x[rows], index.y[rows])
+  (vx, vy) = (np.full(len(rows), np.nan), np.full(len(rows), np.nan))
+  has_previous = np.flatnonzero(ii[1:] == ii[:-1]) + 1
+  dt = t[has_previous] - t[has_previous - 1]
+  vx[has_previous] = (x[has_previous] - x[has_previous - 1]) / dt
+  vy[has_previous] = (y[has_previous] - y[has_previous - 1]) / dt
+  return {'t': t, 'ii': ii, 'vx': vx, 'vy': vy, 'speed': np.sqrt(vx**2 + vy**2)}
+
+def padded_tracks(index: TrajectoryIndex, cells: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+  """ Lay out the positions of `cells` as dense (cell, time since first frame) arrays, along with a mask of the times they were observed. """
+  cells = np.asarray(cells, dtype=np.int64)
+  spans = index.t_max[cells] - index.t_min[cells] + 1
+  length = int(spans.max()) if len(cells) else 0
+  offsets = np.arange(length)
+  in_span = offsets < spans[:, np.newaxis]
+  rows = np.full((len(cells), length), -1, dtype=np.int64)
+  rows[in_span] = index.span_rows[(index.span_start[cells][:, np.newaxis] + offsets)[in_span]]
+  mask = 0 <= rows
+  (x, y) = (np.where(mask, index.x[rows], 0.0), np.where(mask, index.y[rows], 0.0))
+  return x, y, mask.astype(float)
+
+def correlate(a: np.ndarray, b: np.ndarray, max_lag: int) -> np.ndarray:
+  """ Compute sum_cells sum_t a[cell, t] * b[cell, t + lag] for every lag < `max_lag`, by FFT (summing the spectra of every cell first). """
+  # Zero-padding to at least twice the length of the tracks keeps the circular correlation from wrapping around (at lags < length).
+  length: int = a.shape[1]
+  if (length == 0):
+    return np.zeros(0)
+  n = fft.next_fast_len(2 * length)
+  spectrum = np.sum(np.conj(fft.rfft(a, n, axis=1)) * fft.rfft(b, n, axis=1), axis=0)
+  return fft.irfft(spectrum, n)[:min(max_lag, length)]
+
+def correlation_sums(x: np.ndarray, y: np.ndarray, mask: np.ndarray, max_lag: int) -> Dict[str, np.ndarray]:
+  """ Accumulate the sums behind the MSD and VACF of a batch of padded tracks, over every pair of observed times `lag` frames apart. """
+  # |r(t+lag) - r(t)|^2 = r^2(t+lag) + r^2(t) - 2 r(t).r(t+lag), each term counted only where both times were observed.
+  r2 = x**2 + y**2
+  msd = correlate(mask, r2, max_lag) + correlate(r2, mask, max_lag) - 2 * (correlate(x, x, max_lag) + correlate(y, y, max_lag))
+  msd_pairs = correlate(mask, mask, max_lag)
+
+  # Velocities are only taken between consecutive frames, and only where both frames were observed.
+  velocity_mask = mask[:, 1:] * mask[:, :-1]
+  (vx, vy) = (velocity_mask * np.diff(x, axis=1), velocity_mask * np.diff(y, axis=1))
+  vacf = correlate(vx, vx, max_lag) + correlate(vy, vy, max_lag)
+  vacf_pairs = correlate(velocity_mask, velocity_mask, max_lag)
+  return {'msd': msd, 'msd_pairs': msd_pairs, 'vacf': vacf, 'vacf_pairs': vacf_pairs}
+
+def batches(cells: np.ndarray, batch_size: int) -> Iterator[np.ndarray]:
+  """ Split `cells` into batches of (at most) `batch_size` cells. """
+  for start in range(0, len(cells), batch_size):
+    yield cells[start:start + batch_size]
+
+def correlations(index: TrajectoryIndex, cells: np.ndarray = None, max_lag: int = None, batch_size: int = 1024) -> Dict[str, np.ndarray]:
+  """ Compute the ensemble mean-squared displacement and velocity autocorrelation of `cells` (every cell by default) at each lag. """
+  cells = np.arange(len(index.t_min)) if isinstance(cells, type(None)) else np.asarray(cells, dtype=np.int64)
+  max_lag = index.num_frames() if isinstance(max_lag, type(None)) else max_lag
+  sums: Dict[str, np.ndarray] = {name: np.zeros(max_lag) for name in ('msd', 'msd_pairs', 'vacf', 'vacf_pairs')}
+
+  # Cells are grouped by track length, so that each batch is padded as little as possible.
+  cells = cells[np.argsort(index.t_max[cells] - index.t_min[cells], kind='stable')]
+  for batch in batches(cells, batch_size):
+    for name, value in correlation_sums(*padded_tracks(index, batch), max_lag).items():
+      sums[name][:len(value)] += value
+  return lag_table(sums)
+
+def lag_table(sums: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+  """ Turn the accumulated sums into ensemble averages (NaN at lags without any pair of observations). """
+  # Pair counts are integers, so the FFT's round-off is removed before they are used.
+  (msd_pairs, vacf_pairs) = (np.rint(sums['msd_pairs']).astype(np.int64), np.rint(sums['vacf_pairs']).astype(np.int64))
+  with np.errstate(invalid='ignore', divide='ignore'):
+    msd = np.where(0 < msd_pairs, sums['msd'] / msd_pairs, np.nan)
+    vacf = np.where(0 < vacf_pairs, sums['vacf'] / vacf_pairs, np.nan)
+  return {'lag': np.arange(len(msd_pairs)), 'msd': np.maximum(msd, 0.0), 'msd_pairs': msd_pairs, 'vacf': vacf, 'vacf_pairs': vacf_pairs}
+
+def nematic_order(index: TrajectoryIndex) -> Dict[str, np.ndarray]:
+  """ Compute the nematic order parameter S = |<exp(2i theta)>| of the cells' orientations in each frame, and their mean (director) angle. """
+  theta: np.ndarray = index.properties['orientation']
+  observed = np.isfinite(theta)
+  (t, theta) = (index.t[observed], theta[observed])
+  num_frames: int = index.num_frames()
+  num_cells = np.bincount(t, minlength=num_frames)
+  with np.errstate(invalid='ignore', divide='ignore'):
+    q = (np.bincount(t, np.cos(2 * theta), num_frames) + 1j * np.bincount(t, np.sin(2 * theta), num_frames)) / num_cells
+  return {'t': np.arange(num_frames), 'num_cells': num_cells, 'nematic_order': np.abs(q), 'director': np.angle(q) / 2}
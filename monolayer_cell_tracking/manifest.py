@@ -0,0 +1,72 @@
+
+import os, json, hashlib
+import numpy as np
+from typing import Dict
+
+def digest(*parts: any) -> str:
+  """ Combine several values (strings, bytes, or anything with a json representation) into one short content hash. """
+  h = hashlib.blake2b(digest_size=16)
+  for part in parts:
+    if not isinstance(part, (bytes, str)):
+      part = json.dumps(part, sort_keys=True, default=str)
+    h.update(part.encode() if isinstance(part, str) else part)
+    h.update(b'\x00')
+  return h.hexdigest()
+
+def hash_array(array: np.ndarray) -> str:
+  """ Hash the contents (and data type and shape) of an array. """
+  array = np.ascontiguousarray(array)
+  h = hashlib.blake2b(digest_size=16)
+  h.update(f'{array.dtype.str}{array.shape}'.encode())
+  h.update(memoryview(array).cast('B'))
+  return h.hexdigest()
+
+def hash_file(path: str, chunk_size: int = 2**20) -> str:
+  """ Hash the contents of a file (or, for a directory, of every file inside it). """
+  h = hashlib.blake2b(digest_size=16)
+  if os.path.isdir(path):
+    for root, dirs, files in sorted(os.walk(path)):
+      dirs.sort()
+      for name in sorted(files):
+        h.update(os.path.relpath(os.path.join(root, name), path).encode())
+        h.update(hash_file(os.path.join(root, name), chunk_size).encode())
+    return h.hexdigest()
+  with open(path, 'rb') as f:
+    for chunk in iter(lambda: f.read(chunk_size), b''):
+      h.update(chunk)
+  return h.hexdigest()
+
+class Manifest():
+  def __init__(self, path: str) -> None:
+    """ This class records, for each saved output, a hash of the inputs it was computed from (so stale outputs can be detected). """
+    self.path: str = path
+
+    # Records are appended to a json-lines log, in which later records of an output replace earlier ones.
+    self.records: Dict[str, Dict[str, str]] = {}
+    if os.path.exists(path):
+      with open(path) as f:
+        for line in f:
+          try:
+            record: Dict = json.loads(line)
+          except json.JSONDecodeError:
+            # A partially written last line (from an interrupted run) is ignored.
+            continue
+          self.records.setdefault(record['stage'], {})[record['key']] = record['inputs']
+
+  def is_valid(self, stage: str, key: any, inputs: str) -> bool:
+    """ Check whether the output `key` of a `stage` was last saved from the same inputs. """
+    return (self.records.get(stage, {}).get(str(key)) == inputs)
+
+  def is_current(self, stage: str, key: any, inputs: str) -> bool:
+    """ Check whether an existing output `key` of a `stage` is up to date, adopting it (by recording its current inputs) if it has no record. """
+    # Outputs without a record (e.g. downloaded, or saved before the manifest existed) are only recomputed once their inputs change.
+    if (str(key) not in self.records.get(stage, {})):
+      self.record(stage, key, inputs)
+      return True
+    return self.is_valid(stage, key, inputs)
+
+  def record(self, stage: str, key: any, inputs: str) -> None:
+    """ Record that the output `key` of a `stage` has been saved from the given inputs. """
+    self.records.setdefault(stage, {})[str(key)] = inputs
+    with open(self.path, 'a') as f:
+      f.write(json.dumps({'stage': stage, 'key': str(key), 'inputs': inputs}) + '\n')
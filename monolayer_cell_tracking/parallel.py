@@ -0,0 +1,157 @@
+
+import os, time, argparse
+import numpy as np
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Tuple
+from .trajectories import Trajectories
+
+# The trajectories (or visualization) object that worker processes read from. Forked workers inherit it from the parent
+# process, so the segmentation model and tracking data are only loaded once; otherwise each worker loads its own copy once at start-up.
+_trajectories: Trajectories = None
+
+def _init_worker(cls: type, args: Tuple, kwargs: Dict, profile: bool = False) -> None:
+  """ Make sure that the worker process has a trajectories object to read from (constructed as the parent's was, if not inherited). """
+  global _trajectories
+  if isinstance(_trajectories, type(None)):
+    # The parent process has already brought the trajectories up to date, so the worker loads them without checking again.
+    _trajectories = cls(*args, **{**kwargs, 'profile': profile, 'fast_start': True})
+
+def _worker_initargs(trajectories: Trajectories) -> Tuple:
+  """ The arguments that `_init_worker()` needs to construct a copy of `trajectories` (with the same class, settings and profiling). """
+  return (type(trajectories), trajectories.init_args, trajectories.init_kwargs, trajectories.profiler.enabled)
+
+def _worker_profile() -> Dict:
+  """ Collect (and reset) the stages, counters and trace events that the worker process has recorded since its last task. """
+  profiler = _trajectories.profiler
+  profile: Dict = {'report': profiler.report(), 'events': profiler.events}
+  profiler.reset()
+  return profile
+
+def _pool_context() -> multiprocessing.context.BaseContext:
+  """ Prefer forking, so that the workers share the parent's (read-only) trajectories object. """
+  if 'fork' in multiprocessing.get_all_start_methods():
+    return multiprocessing.get_context('fork')
+  return multiprocessing.get_context()
+
+def _compute_shard(shard: Dict[int, List[int]]) -> Tuple[List[Tuple[int, Dict[int, Dict]]], Dict]:
+  """ Compute the trajectory data of the cells in each frame of a shard (return the data and the worker's throughput). """
+  _trajectories.profiler.reset()
+  start = time.perf_counter()
+  frames = [(t, _trajectories.frame_data(t, cells)) for t, cells in shard.items()]
+  stats = {'pid': os.getpid(), 'frames': len(frames), 'rows': sum(len(rows) for _, rows in frames), 'seconds': time.perf_counter() - start}
+  stats['profile'] = _worker_profile()
+  return frames, stats
+
+def shard_frames(frame_cells: Dict[int, List[int]], num_shards: int) -> List[Dict[int, List[int]]]:
+  """ Split the work into contiguous ranges of frames. """
+  frames: List[int] = list(frame_cells)
+  return [{t: frame_cells[t] for t in chunk.tolist()} for chunk in np.array_split(frames, num_shards) if len(chunk)]
+
+def shard_cells(frame_cells: Dict[int, List[int]], cells: List[int], num_shards: int) -> List[Dict[int, List[int]]]:
+  """ Split the work into contiguous ranges of cells (each shard still visits its cells' frames in time order). """
+  shards: List[Dict[int, List[int]]] = []
+  for chunk in np.array_split(cells, num_shards):
+    chunk = set(chunk.tolist())
+    shard = {t: [ii for ii in cells_t if ii in chunk] for t, cells_t in frame_cells.items()}
+    shard = {t: cells_t for t, cells_t in shard.items() if cells_t}
+    if shard:
+      shards.append(shard)
+  return shards
+
+def parallel_dump_data(trajectories: Trajectories, num_workers: int = None, shard_by: str = 'frames', shards_per_worker: int = 4, ii: int = -1, format: str = 'csv') -> Dict[int, Dict]:
+  """ Run `Trajectories.dump_data()` across a pool of worker processes (return the throughput of each worker). """
+  global _trajectories
+  num_workers: int = num_workers or os.cpu_count()
+  digests: Dict[int, Tuple[str, str]] = {}
+  cells: List[int] = trajectories.pending_cells(ii, format, digests)
+  frame_cells: Dict[int, List[int]] = trajectories.frame_cells(cells)
+
+  num_shards = num_workers * shards_per_worker
+  if (shard_by == 'frames'):
+    shards = shard_frames(frame_cells, num_shards)
+  elif (shard_by == 'cells'):
+    shards = shard_cells(frame_cells, cells, num_shards)
+  else:
+    raise ValueError(f'Unknown sharding strategy: {shard_by}')
+
+  context = _pool_context()
+  _trajectories = trajectories
+
+  # Shard results are merged in submission order, so the saved data does not depend on worker scheduling.
+  throughput: Dict[int, Dict] = {}
+  def merged_frames():
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=context, initializer=_init_worker, initargs=_worker_initargs(trajectories)) as executor:
+      for frames, stats in executor.map(_compute_shard, shards):
+        worker = throughput.setdefault(stats['pid'], {'shards': 0, 'frames': 0, 'rows': 0, 'seconds': 0.0})
+        worker['shards'] += 1
+        worker['frames'] += stats['frames']
+        worker['rows'] += stats['rows']
+        worker['seconds'] += stats['seconds']
+        trajectories.profiler.merge(stats['profile']['report'], stats['profile']['events'])
+        yield from frames
+  if (format == 'csv'):
+    trajectories.dump_frames(merged_frames(), cells, digests)
+  else:
+    trajectories.export_frames(merged_frames(), cells, format, digests)
+
+  for pid, worker in sorted(throughput.items()):
+    worker['frames_per_second'] = worker['frames'] / max(worker['seconds'], 1e-9)
+    print(f"worker {pid}: {worker['shards']} shards, {worker['frames']} frames, {worker['rows']} rows in {worker['seconds']:.1f}s ({worker['frames_per_second']:.2f} frames/s)")
+  return throughput
+
+def _render_chunk(task: Tuple[str, List[int], Dict]) -> Tuple[List[np.ndarray], Dict]:
+  """ Render a chunk of consecutive movie frames in a worker process (return the frames and the worker's profile). """
+  (method, frames, kwargs) = task
+  _trajectories.profiler.reset()
+  rendered: List[np.ndarray] = [_trajectories.render_frame(method, t, **kwargs) for t in frames]
+  return rendered, _worker_profile()
+
+def render_frames(visualization: Trajectories, method: str, frames: List[int], num_workers: int = None, chunk_size: int = 4, **kwargs) -> Iterator[np.ndarray]:
+  """ Render movie frames with `visualization.<method>(t, **kwargs)` across a pool of worker processes (yielding them in order). """
+  global _trajectories
+  num_workers: int = num_workers or os.cpu_count()
+  frames: List[int] = list(frames)
+  chunks: List[List[int]] = [frames[kk:kk+chunk_size] for kk in range(0, len(frames), chunk_size)]
+  _trajectories = visualization
+
+  def rendered_chunk(future: any) -> List[np.ndarray]:
+    (rendered, profile) = future.result()
+    visualization.profiler.merge(profile['report'], profile['events'])
+    return rendered
+
+  # Keep a bounded number of chunks in flight, so that rendered frames never pile up in memory.
+  with ProcessPoolExecutor(max_workers=num_workers, mp_context=_pool_context(), initializer=_init_worker, initargs=_worker_initargs(visualization)) as executor:
+    in_flight = deque()
+    for chunk in chunks:
+      in_flight.append(executor.submit(_render_chunk, (method, chunk, kwargs)))
+      if (2 * num_workers < len(in_flight)):
+        yield from rendered_chunk(in_flight.popleft())
+    while in_flight:
+      yield from rendered_chunk(in_flight.popleft())
+
+def main() -> None:
+  """ Command line entry point for parallel trajectory data extraction. """
+  parser = argparse.ArgumentParser(description='Extract the trajectory data of each cell in a video, in parallel.')
+  parser.add_argument('src', help='path to the microscopy (mp4) video')
+  parser.add_argument('model_path', help='path to the cellpose segmentation model')
+  parser.add_argument('--workers', type=int, default=None, help='number of worker processes (default: all cores)')
+  parser.add_argument('--shard-by', choices=['frames', 'cells'], default='frames', help='split the work by frame range or by cell range')
+  parser.add_argument('--cell', type=int, default=-1, help='only extract the trajectory data of this cell (csv format only)')
+  parser.add_argument('--format', choices=['csv', 'parquet', 'feather'], default='csv', help='save one csv file per cell, or columnar cell and neighbor tables')
+  parser.add_argument('--profile', default=None, help='json file to save the time spent in each stage (and bytes read and written) to')
+  parser.add_argument('--trace', default=None, help='json file to save trace events of each stage to (viewable with chrome://tracing or Perfetto)')
+  args = parser.parse_args()
+  if (0 <= args.cell) and (args.format != 'csv'):
+    parser.error('--cell can only be combined with --format csv (columnar tables always cover every cell)')
+
+  trajectories = Trajectories(src=args.src, model_path=args.model_path, profile=bool(args.profile or args.trace))
+  parallel_dump_data(trajectories, num_workers=args.workers, shard_by=args.shard_by, ii=args.cell, format=args.format)
+  if args.profile:
+    trajectories.profiler.save(args.profile)
+  if args.trace:
+    trajectories.profiler.save_trace(args.trace)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,89 @@
+
+import os, json, time, threading
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterator, List
+from .cache import LRUCache
+
+class Profiler():
+  def __init__(self, enabled: bool = False, cache: LRUCache = None, max_events: int = 2**20) -> None:
+    """ This class accumulates the time spent in each stage of the pipeline, and counters (e.g. of bytes read and written). """
+    self.enabled: bool = enabled
+    self.cache: LRUCache = cache
+    self.lock = threading.Lock()
+
+    # Total (inclusive) time spent in each stage, and how often it was entered.
+    self.stages: Dict[str, Dict[str, float]] = {}
+    self.counters: Dict[str, int] = {}
+
+    # Each time a stage is entered, it is also recorded as a trace event (up to `max_events`, beyond which events are dropped).
+    self.max_events: int = max_events
+    self.events: List[Dict] = []
+
+  def stage(self, name: str) -> any:
+    """ Time a block of code as part of the stage `name` (a no-op if profiling is disabled). """
+    return self.timed(name) if self.enabled else nullcontext()
+
+  @contextmanager
+  def timed(self, name: str) -> Iterator[None]:
+    """ Record the time spent inside the `with` block to the stage `name`. """
+    start = time.perf_counter_ns()
+    try:
+      yield
+    finally:
+      end = time.perf_counter_ns()
+      seconds = (end - start) * 1e-9
+      with self.lock:
+        stage = self.stages.setdefault(name, {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+        stage['count'] += 1
+        stage['seconds'] += seconds
+        stage['max_seconds'] = max(stage['max_seconds'], seconds)
+        if (len(self.events) < self.max_events):
+          self.events.append({'name': name, 'ph': 'X', 'ts': start / 1e3, 'dur': (end - start) / 1e3, 'pid': os.getpid(), 'tid': threading.get_ident()})
+        else:
+          self.counters['dropped_events'] = self.counters.get('dropped_events', 0) + 1
+
+  def count(self, name: str, value: int = 1) -> None:
+    """ Add `value` to the counter `name` (a no-op if profiling is disabled). """
+    if self.enabled:
+      with self.lock:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+  def reset(self) -> None:
+    """ Forget every stage, counter and event recorded so far. """
+    with self.lock:
+      self.stages = {}
+      self.counters = {}
+      self.events = []
+
+  def merge(self, report: Dict, events: List[Dict] = ()) -> None:
+    """ Add the stages, counters (and trace events) recorded by another profiler (e.g. that of a worker process). """
+    with self.lock:
+      for name, other in report['stages'].items():
+        stage = self.stages.setdefault(name, {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+        stage['count'] += other['count']
+        stage['seconds'] += other['seconds']
+        stage['max_seconds'] = max(stage['max_seconds'], other['max_seconds'])
+      for name, value in report['counters'].items():
+        self.counters[name] = self.counters.get(name, 0) + value
+      self.events.extend(events[:max(self.max_events - len(self.events), 0)])
+
+  def report(self) -> Dict[str, any]:
+    """ Summarize the time spent in each stage, the counters and (if there is one) the cache's usage. """
+    with self.lock:
+      stages = {name: {**stage, 'mean_seconds': stage['seconds'] / max(stage['count'], 1)} for name, stage in self.stages.items()}
+      report = {'stages': stages, 'counters': dict(self.counters)}
+    if not isinstance(self.cache, type(None)):
+      report['cache'] = self.cache.stats()
+    return report
+
+  def save(self, path: str) -> None:
+    """ Save the report as a json file. """
+    with open(path, 'w') as f:
+      json.dump(self.report(), f, indent=2)
+
+  def save_trace(self, path: str) -> None:
+    """ Save the trace events as a json file, in the Trace Event Format (viewable with chrome://tracing or Perfetto). """
+    with self.lock:
+      trace = {'traceEvents': list(self.events), 'displayTimeUnit': 'ms'}
+    with open(path, 'w') as f:
+      json.dump(trace, f)
@@ -1,72 +1,383 @@
 
-import os, glob
+import os, time, json
 import numpy as np
+import pandas as pd
+import multiprocessing
 from tqdm import tqdm
-from typing import Dict
-from cellpose import models, utils
-from shapely.geometry import Polygon, Point
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Dict, List, Tuple
 from .video import Video
+from .store import SegmentationStore
+from .files import atomic_write
+from .manifest import Manifest, digest, hash_array, hash_file
+from .contours import CellContours, trace_outlines, load_contours
+
+# The segmentation model of a worker process, loaded once when the worker starts (see `compute_segmentations()`).
+_worker_model: any = None
+
+def _init_segmentation_worker(model_path: str, num_threads: int) -> None:
+  """ Load the segmentation model in a worker process, and limit the number of threads it may use. """
+  global _worker_model
+  import torch
+  from cellpose import models
+  torch.set_num_threads(num_threads)
+  _worker_model = models.CellposeModel(pretrained_model=model_path)
+
+def _segment_batch(frames: List[np.ndarray], tiling: Dict = None) -> List[np.ndarray]:
+  """ Segment a batch of video frames in a worker process. """
+  return segment_frames(_worker_model, frames, tiling)
+
+def segment_frames(model: any, frames: List[np.ndarray], tiling: Dict = None) -> List[np.ndarray]:
+  """ Return the segmentation masks for a batch of video frames, evaluated by the model in a single call (or tile by tile, see `segment_tiles()`). """
+  if tiling:
+    return [segment_tiles(model, frame, **tiling) for frame in frames]
+  return list(model.eval(frames, channels=[0, 0], diameter=model.diam_labels.copy())[0])
+
+def tile_starts(length: int, tile_size: int, overlap: int) -> List[int]:
+  """ Place overlapping tiles of size `tile_size` along an axis of size `length`, so that they cover it completely. """
+  if (length <= tile_size):
+    return [0]
+  starts: List[int] = list(range(0, length - tile_size + 1, tile_size - overlap))
+  if (starts[-1] + tile_size < length):
+    starts.append(length - tile_size)
+  return starts
+
+def tile_cores(starts: List[int], tile_size: int, length: int) -> List[Tuple[float, float]]:
+  """ Split an axis between overlapping tiles at the middle of each overlap, so that each point belongs to exactly one tile's core. """
+  seams: List[float] = [(starts[kk+1] + starts[kk] + tile_size) / 2 for kk in range(len(starts) - 1)]
+  return list(zip([0] + seams, seams + [length]))
+
+def segment_tiles(model: any, frame: np.ndarray, tile_size: int, overlap: int = None, num_threads: int = 1) -> np.ndarray:
+  """ Segment a (large) video frame as a grid of overlapping tiles, and stitch the tiles' labels into one mask. """
+  (Ly, Lx) = frame.shape[:2]
+  overlap: int = int(2 * model.diam_labels) if isinstance(overlap, type(None)) else overlap
+  assert (0 <= overlap < tile_size)
+  (y_starts, x_starts) = (tile_starts(Ly, tile_size, overlap), tile_starts(Lx, tile_size, overlap))
+  (y_cores, x_cores) = (tile_cores(y_starts, tile_size, Ly), tile_cores(x_starts, tile_size, Lx))
+  tiles: List[Tuple[int, int]] = [(kk, ll) for kk in range(len(y_starts)) for ll in range(len(x_starts))]
+
+  # Tiles are segmented concurrently (the model releases the GIL while it evaluates).
+  def segment_tile(tile: Tuple[int, int]) -> np.ndarray:
+    (y0, x0) = (y_starts[tile[0]], x_starts[tile[1]])
+    return model.eval(frame[y0:y0+tile_size, x0:x0+tile_size], channels=[0, 0], diameter=model.diam_labels.copy())[0]
+  with ThreadPoolExecutor(max_workers=num_threads) as executor:
+    tile_masks: List[np.ndarray] = list(executor.map(segment_tile, tiles))
+
+  # Each cell is kept only by the tile whose core contains its centroid, so cells cut by a tile's edge are taken from a neighboring tile.
+  # This is exact as long as no pixel of a cell lies farther than overlap/4 from its centroid (along either axis); otherwise the part of a
+  # cell cut off by a tile's edge may have its centroid inside that tile's core, and the cell is kept twice.
+  masks = np.zeros((Ly, Lx), dtype=np.uint32)
+  num_labels: int = 0
+  for (kk, ll), tile_mask in zip(tiles, tile_masks):
+    (y0, x0) = (y_starts[kk], x_starts[ll])
+    (Ty, Tx) = tile_mask.shape
+    flat_mask = tile_mask.ravel().astype(np.int64)
+    counts = np.bincount(flat_mask)
+    (py, px) = np.divmod(np.arange(flat_mask.size), Tx)
+    with np.errstate(invalid='ignore', divide='ignore'):
+      cy = y0 + np.bincount(flat_mask, weights=py, minlength=len(counts)) / counts
+      cx = x0 + np.bincount(flat_mask, weights=px, minlength=len(counts)) / counts
+    ((ya, yb), (xa, xb)) = (y_cores[kk], x_cores[ll])
+    keep = (0 < counts) & (ya <= cy) & (cy < yb) & (xa <= cx) & (cx < xb)
+    keep[0] = False
+
+    # Give the kept cells new labels, and only claim pixels that no previous tile has claimed.
+    relabel = np.zeros(len(counts), dtype=np.uint32)
+    relabel[keep] = num_labels + 1 + np.arange(np.count_nonzero(keep))
+    num_labels += np.count_nonzero(keep)
+    tile_labels = relabel[tile_mask]
+    region = masks[y0:y0+Ty, x0:x0+Tx]
+    claim = (tile_labels != 0) & (region == 0)
+    region[claim] = tile_labels[claim]
+
+  # Number the labels consecutively (as cellpose does), in case any cell lost all of its pixels to its neighbors.
+  labels, inverse = np.unique(masks, return_inverse=True)
+  if (labels[0] != 0):
+    inverse += 1
+  return inverse.reshape(Ly, Lx).astype(np.uint32)
 
 class Segmentation(Video):
-  def __init__(self, src: str, model_path: str) -> None:
+  def __init__(self, src: str, model_path: str, tile_size: int = None, tile_overlap: int = None, tile_workers: int = 1, **kwargs) -> None:
     """ This class is used to segment video data. """
-    Video.__init__(self, src)
+    Video.__init__(self, src, **kwargs)
+
+    self.model_path: str = model_path
+    self.store = SegmentationStore(os.path.join(self.dst, 'segmentations'))
+    self.manifest = Manifest(os.path.join(self.dst, 'manifest.jsonl'))
+
+    # The segmentation model is only loaded once it is needed (see `model`), so that reading saved outputs starts quickly.
+    self.segmentation_model: any = None
+
+    # Points on the background are assigned to the most common label within this many pixels (see `lookup_label()`).
+    self.lookup_radius: int = 2
 
-    self.model: any = self.load_segmentation_model(model_path)
+    # Frames larger than `tile_size` pixels are segmented as overlapping tiles, `tile_workers` tiles at a time (see `segment_tiles()`).
+    self.tiling: Dict = {'tile_size': tile_size, 'overlap': tile_overlap, 'num_threads': tile_workers} if tile_size else None
 
-    # Store the segmentation data for the ensemble of cells at a specific frame.
-    self.cells: Dict = None
-    self.cell_frame: int = -1
+  @property
+  def model(self) -> any:
+    """ The segmentation model, loaded on first use. """
+    if isinstance(self.segmentation_model, type(None)):
+      self.segmentation_model = self.load_segmentation_model(self.model_path)
+    return self.segmentation_model
 
   def load_segmentation_model(self, model_path: str) -> any:
     """ Segmentation models are loaded as follows. """
+    from cellpose import models
     return models.CellposeModel(pretrained_model=model_path)
 
+  def metadata_file(self) -> str:
+    """ Default naming convention for the metadata of the segmentation model(s) used on the video. """
+    return os.path.join(self.dst, 'metadata.json')
+
+  def load_metadata(self) -> Dict:
+    """ Load the saved metadata (empty if there is none). """
+    if not os.path.exists(self.metadata_file()):
+      return {}
+    with open(self.metadata_file()) as f:
+      return json.load(f)
+
+  def save_metadata(self, metadata: Dict) -> None:
+    """ Save the metadata to its json file. """
+    with atomic_write(self.metadata_file()) as tmp_file, open(tmp_file, 'w') as f:
+      json.dump(metadata, f, indent=2)
+
+  def cell_diameter(self) -> float:
+    """ The typical cell diameter that the segmentation model was trained on (saved per model, so that it is only loaded once). """
+    metadata: Dict = self.load_metadata()
+    diameters: Dict[str, float] = metadata.setdefault('diam_labels', {})
+    if self.model_digest() not in diameters:
+      diameters[self.model_digest()] = float(self.model.diam_labels)
+      self.save_metadata(metadata)
+    return diameters[self.model_digest()]
+
   def segment_image(self, t: int) -> np.ndarray:
     """ Return the segmenation masks for the video frame at time `t`. """
-    return self.model.eval(self.load_frame(t), channels=[0, 0], diameter=self.model.diam_labels.copy())[0]
+    with self.profiler.stage('segment'):
+      return segment_frames(self.model, [self.load_frame(t)], self.tiling)[0]
 
   def segmentation_file(self, t: int) -> str:
-    """ Default naming convention for video frame segmentation files. """
+    """ Default naming convention for (legacy, per-frame) video frame segmentation files. """
     return os.path.join(self.dst, f't={t}.npz')
 
-  def num_frames(self) -> int:
-    """ Count how many video frame image datafiles there are. """
-    return len(glob.glob(os.path.join(self.dst, '*.png')))
+  def model_digest(self) -> str:
+    """ Hash the weights of the segmentation model. """
+    return self.cache.get(('digest', 'model'), lambda: hash_file(self.model_path))
+
+  def frame_digest(self, t: int) -> str:
+    """ Hash the image data of the video frame at time `t`. """
+    return self.cache.get(('digest', 'frame', t), lambda: hash_array(self.load_frame(t)))
+
+  def masks_digest(self, t: int) -> str:
+    """ Hash the segmentation masks of the video frame at time `t`. """
+    return self.cache.get(('digest', 'masks', t), lambda: hash_array(self.load_segmentations(t)))
+
+  def segmentation_inputs(self, t: int) -> str:
+    """ Hash the inputs that the segmentation masks of the video frame at time `t` are computed from. """
+    if self.tiling:
+      return digest(self.frame_digest(t), self.model_digest(), self.tiling)
+    return digest(self.frame_digest(t), self.model_digest())
+
+  def masks_dtype(self, masks: np.ndarray) -> type:
+    """ The data type that the segmentation store is created with (wide enough for every label of a tiled, whole-well frame). """
+    return np.promote_types(np.uint32 if self.tiling else np.uint16, masks.dtype).type
+
+  def is_segmented(self, t: int) -> bool:
+    """ Check whether the segmentation masks of the video frame at time `t` have been saved from its current frame and model. """
+    if not (self.store.is_written(t) or os.path.exists(self.segmentation_file(t))):
+      return False
+    return self.manifest.is_current('segmentation', t, self.segmentation_inputs(t))
+
+  def load_frames(self, frames: List[int]) -> List[np.ndarray]:
+    """ Load the image data of several video frames. """
+    return [self.load_frame(t) for t in frames]
+
+  def save_segmentations(self, frames: List[int], masks: List[np.ndarray]) -> None:
+    """ Save the segmentation masks of several video frames to the segmentation store. """
+    for t, masks_t in zip(frames, masks):
+      if not self.store.exists():
+        self.store.create(self.num_frames(), masks_t.shape, self.masks_dtype(masks_t))
+      self.store.write(t, masks_t)
+      self.manifest.record('segmentation', t, self.segmentation_inputs(t))
+      self.profiler.count('bytes_written', masks_t.nbytes)
+      self.profiler.count('frames_segmented')
+
+  def compute_segmentations(self, batch_size: int = 1, num_workers: int = 1, threads_per_worker: int = None, frames: List[int] = None) -> Dict:
+    """ Obtain the segmentations for all frames in the video (or only `frames`) that have not yet been segmented (return the throughput). """
+    frames: List[int] = range(self.num_frames()) if isinstance(frames, type(None)) else frames
+    pending: List[int] = [t for t in frames if not self.is_segmented(t)]
+    batches: List[List[int]] = [pending[kk:kk+batch_size] for kk in range(0, len(pending), batch_size)]
+    start = time.perf_counter()
+
+    # Optionally segment batches in worker processes, splitting the available cores evenly between them by default.
+    pool = nullcontext()
+    if (1 < num_workers):
+      num_threads = threads_per_worker or max(1, os.cpu_count() // num_workers)
+      pool = ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context('spawn'), initializer=_init_segmentation_worker, initargs=(self.model_path, num_threads))
 
-  def compute_segmentations(self) -> None:
-    """ Obtain the segmentations for all frames in the video (return the total number of frames). """
-    for t in tqdm(range(self.num_frames())):
-      if os.path.exists(self.segmentation_file(t)):
-        continue
-      masks: np.ndarray = self.segment_image(t)
-      np.savez_compressed(self.segmentation_file(t), masks)
+    with pool as pool, ThreadPoolExecutor(max_workers=1) as prefetcher, tqdm(total=len(pending)) as progress:
+      in_flight = deque()
+      def save_oldest_batch() -> None:
+        (frames, masks) = in_flight.popleft()
+        with self.profiler.stage('segment'):
+          masks: List[np.ndarray] = masks.result()
+        self.save_segmentations(frames, masks)
+        progress.update(len(frames))
+
+      # Decode the next batch of frames in the background while the current batch is being segmented.
+      next_batch = prefetcher.submit(self.load_frames, batches[0]) if batches else None
+      for kk, frames in enumerate(batches):
+        images: List[np.ndarray] = next_batch.result()
+        if (kk + 1 < len(batches)):
+          next_batch = prefetcher.submit(self.load_frames, batches[kk+1])
+        if isinstance(pool, type(None)):
+          with self.profiler.stage('segment'):
+            masks: List[np.ndarray] = segment_frames(self.model, images, self.tiling)
+          self.save_segmentations(frames, masks)
+          progress.update(len(frames))
+        else:
+          # Keep a bounded number of batches in flight, saving them in order as they complete.
+          in_flight.append((frames, pool.submit(_segment_batch, images, self.tiling)))
+          while (2 * num_workers < len(in_flight)):
+            save_oldest_batch()
+      while in_flight:
+        save_oldest_batch()
+
+    seconds = time.perf_counter() - start
+    throughput = {'frames': len(pending), 'seconds': seconds, 'frames_per_second': len(pending) / max(seconds, 1e-9)}
+    print(f"Segmented {throughput['frames']} frames in {seconds:.1f}s ({throughput['frames_per_second']:.2f} frames/s)")
+    return throughput
 
   def load_segmentations(self, t: int) -> np.ndarray:
-    """ Load the segmentation masks stored in a compressed numpy file. """
-    npz_file = np.load(self.segmentation_file(t))
-    return npz_file['arr_0']
-
-  def cell_contours(self, t: int) -> Dict:
-    """ Extract the (x,y) coordinates defining each cell's segmentation. """
-    if (t == self.cell_frame):
-      return self.cells
-    else:
-      self.cell_frame = t
-      self.cells: Dict = {}
+    """ Load the segmentation masks of the video frame at time `t` (masks are cached, so they are read-only). """
+    return self.cache.get(('masks', t), lambda: self.read_segmentations(t))
+
+  def read_segmentations(self, t: int) -> np.ndarray:
+    """ Read the segmentation masks of the video frame at time `t` from disk, bypassing the cache. """
+    with self.profiler.stage('read_masks'):
+      if self.store.is_written(t):
+        masks: np.ndarray = self.store.read(t)
+      else:
+        npz_file = np.load(self.segmentation_file(t))
+        masks: np.ndarray = npz_file['arr_0']
+        masks.flags.writeable = False
+    self.profiler.count('bytes_read', masks.nbytes)
+    return masks
+
+  def contours_file(self, t: int) -> str:
+    """ Default naming convention for the packed cell contours of the video frame at time `t`. """
+    contours_dir = os.path.join(self.dst, 'contours')
+    os.makedirs(contours_dir, exist_ok=True)
+    return os.path.join(contours_dir, f't={t}.npz')
+
+  def cell_contours(self, t: int) -> CellContours:
+    """ Extract the (x,y) coordinates defining each cell's segmentation, indexed by segmentation label. """
+    return self.cache.get(('contours', t), lambda: self.read_cell_contours(t))
+
+  def read_cell_contours(self, t: int) -> CellContours:
+    """ Read the saved cell contours at time `t` from disk (tracing and saving them first, if missing or stale), bypassing the cache. """
+    inputs: str = self.masks_digest(t)
+    if os.path.exists(self.contours_file(t)) and self.manifest.is_current('contours', t, inputs):
+      with self.profiler.stage('read_contours'):
+        contours: CellContours = load_contours(self.contours_file(t))
+      self.profiler.count('bytes_read', os.path.getsize(self.contours_file(t)))
+      return contours
+    contours: CellContours = self.compute_cell_contours(t)
+    self.save_cell_contours(t, contours)
+    return contours
+
+  def save_cell_contours(self, t: int, contours: CellContours) -> None:
+    """ Save the cell contours of the video frame at time `t`. """
+    contours.save(self.contours_file(t))
+    self.manifest.record('contours', t, self.masks_digest(t))
+    self.profiler.count('bytes_written', os.path.getsize(self.contours_file(t)))
+
+  def compute_cell_contours(self, t: int) -> CellContours:
+    """ Trace the outline of each cell's segmentation at time `t`, bypassing the cache and the saved contours. """
+    with self.profiler.stage('contours'):
+      return trace_outlines(self.load_segmentations(t))
+
+  def extract_contours(self, frames: List[int] = None, num_workers: int = 1) -> None:
+    """ Trace and save the cell contours of every frame (or only `frames`) that are missing or stale, optionally across `num_workers` processes. """
+    frames: List[int] = range(self.num_frames()) if isinstance(frames, type(None)) else frames
+    pending: List[int] = [t for t in frames if not (os.path.exists(self.contours_file(t)) and self.manifest.is_current('contours', t, self.masks_digest(t)))]
+    if (num_workers <= 1):
+      for t in tqdm(pending):
+        self.save_cell_contours(t, self.compute_cell_contours(t))
+      return None
+
+    # Keep a bounded number of frames in flight, saving their contours in order as they complete.
+    with ProcessPoolExecutor(max_workers=num_workers) as pool, tqdm(total=len(pending)) as progress:
+      in_flight = deque()
+      def save_oldest_frame() -> None:
+        (t, contours) = in_flight.popleft()
+        with self.profiler.stage('contours'):
+          contours: CellContours = contours.result()
+        self.save_cell_contours(t, contours)
+        progress.update(1)
+
+      for t in pending:
+        in_flight.append((t, pool.submit(trace_outlines, np.asarray(self.load_segmentations(t)))))
+        while (2 * num_workers < len(in_flight)):
+          save_oldest_frame()
+      while in_flight:
+        save_oldest_frame()
+
+  def label_table(self, t: int) -> Dict[int, Dict]:
+    """ Map each segmentation label at time `t` to its cell's contour, bounding box and (flattened) pixel indices. """
+    return self.cache.get(('labels', t), lambda: self.compute_label_table(t))
+
+  def compute_label_table(self, t: int) -> Dict[int, Dict]:
+    """ Build the table of segmentation labels at time `t`, bypassing the cache. """
+    with self.profiler.stage('label_table'):
+      table: Dict = {}
       segmentations = self.load_segmentations(t)
-      for ii, cell_outline in enumerate(utils.outlines_list(segmentations)):
-        self.cells[ii] = {}
-        self.cells[ii]['x'] = cell_outline.flatten()[::2]
-        self.cells[ii]['y'] = cell_outline.flatten()[1::2]
-      return self.cells
+      (Ly, Lx) = segmentations.shape
+
+      # Sort the pixels by label, so that each label's pixels form one contiguous block.
+      flat_segmentations = segmentations.ravel()
+      order = np.argsort(flat_segmentations, kind='stable')
+      labels, starts, counts = np.unique(flat_segmentations[order], return_index=True, return_counts=True)
+      (py, px) = np.divmod(order, Lx)
+      (y0, y1) = (np.minimum.reduceat(py, starts), np.maximum.reduceat(py, starts) + 1)
+      (x0, x1) = (np.minimum.reduceat(px, starts), np.maximum.reduceat(px, starts) + 1)
+
+      contours: CellContours = self.cell_contours(t)
+      for kk, label in enumerate(labels.tolist()):
+        if (label == 0):
+          continue
+        contour = contours.get(label, {'x': np.zeros(0, dtype=int), 'y': np.zeros(0, dtype=int)})
+        table[label] = {
+          'x': contour['x'],
+          'y': contour['y'],
+          'label': label,
+          'bbox': (int(y0[kk]), int(y1[kk]), int(x0[kk]), int(x1[kk])),
+          'pixels': order[starts[kk]:starts[kk]+counts[kk]]}
+      return table
+
+  def lookup_label(self, segmentations: np.ndarray, x0: float, y0: float) -> int:
+    """ Find the label at the point (x0,y0); if it is background, fall back to the most common label within `lookup_radius` pixels (0 if none). """
+    (Ly, Lx) = segmentations.shape
+    (x, y) = (int(x0), int(y0))
+    if not ((0 <= x < Lx) and (0 <= y < Ly)):
+      return 0
+    elif (segmentations[y, x] != 0):
+      return int(segmentations[y, x])
+    r = self.lookup_radius
+    window = segmentations[max(0, y-r):y+r+1, max(0, x-r):x+r+1]
+    window = window[window != 0]
+    if (window.size == 0):
+      return 0
+    labels, counts = np.unique(window, return_counts=True)
+    return int(labels[np.argmax(counts)])
 
   def lookup_cell_contour(self, t: int, x0: float, y0: float) -> Dict:
     """ Find the cell that contains the point (x0,y0); returns `None` if failure. """
-    point = Point(x0, y0)
-    for cell in self.cell_contours(t).values():
-      if point.within(Polygon(zip(cell['x'], cell['y']))):
-        return cell
+    with self.profiler.stage('lookup'):
+      table: Dict[int, Dict] = self.label_table(t)
+      return table.get(self.lookup_label(self.load_segmentations(t), x0, y0))
 
   def shared_edge(self, cell_1: Dict, cell_2: Dict) -> np.ndarray:
     """ Find the coordinates that two cells. """
@@ -78,15 +389,97 @@ class Segmentation(Video):
           connected_points.append([int(x2), int(y2)])
     return np.array(connected_points)
 
+  def label_adjacency(self, segmentations: np.ndarray, radius: float = 2.0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ Find every pair of labels with pixels within `radius` of each other, and count the points along their shared edge. """
+    (Ly, Lx) = segmentations.shape
+    r = int(radius)
+    pairs: List[np.ndarray] = []
+    is_edge: List[np.ndarray] = []
+
+    # Compare the segmentations against a shifted copy of themselves, once for each pixel offset within `radius`.
+    for dy in range(0, r+1):
+      for dx in range(-r, r+1):
+        if (dy == 0 and dx <= 0) or (radius < np.sqrt(dx**2 + dy**2)):
+          continue
+        a = segmentations[0:Ly-dy, max(0, -dx):Lx-max(0, dx)]
+        b = segmentations[dy:Ly, max(0, dx):Lx-max(0, -dx)]
+        in_contact = (a != b) & (a != 0) & (b != 0)
+        pairs.append(np.stack((a[in_contact], b[in_contact])))
+        is_edge.append(np.full(pairs[-1].shape[1], (dx**2 + dy**2) <= 1))
+
+    # Pixels in direct contact contribute two points to the shared edge (as in `shared_edge()`).
+    pairs: np.ndarray = np.sort(np.concatenate(pairs, axis=1).astype(np.int64), axis=0)
+    n = int(segmentations.max()) + 1
+    keys, inverse = np.unique(pairs[0] * n + pairs[1], return_inverse=True)
+    num_contact_pnts = 2 * np.bincount(inverse.ravel(), weights=np.concatenate(is_edge), minlength=len(keys)).astype(int)
+    (label_1, label_2) = np.divmod(keys, n)
+    return label_1, label_2, num_contact_pnts
+
+  def cell_contacts(self, t: int) -> Dict[int, Dict[int, int]]:
+    """ Map each segmentation label at time `t` to its contacting labels, and their number of shared edge points. """
+    return self.cache.get(('contacts', t), lambda: self.compute_cell_contacts(t))
+
+  def compute_cell_contacts(self, t: int) -> Dict[int, Dict[int, int]]:
+    """ Build the cell-cell contact graph of the segmentations at time `t`, bypassing the cache. """
+    with self.profiler.stage('neighbors'):
+      adjacency: Dict = {}
+      for (label_1, label_2, num_contact_pnts) in zip(*self.label_adjacency(self.load_segmentations(t))):
+        adjacency.setdefault(int(label_1), {})[int(label_2)] = int(num_contact_pnts)
+        adjacency.setdefault(int(label_2), {})[int(label_1)] = int(num_contact_pnts)
+      return adjacency
+
+  def color_statistics(self, t: int, statistics: Tuple[str] = ('mean',)) -> pd.DataFrame:
+    """ Compute statistics ('mean', 'std', 'min', 'max', 'median') of each color channel over every segmentation label at time `t`. """
+    return self.cache.get(('colors', t, tuple(statistics)), lambda: self.compute_color_statistics(t, statistics))
+
+  def compute_color_statistics(self, t: int, statistics: Tuple[str] = ('mean',)) -> pd.DataFrame:
+    """ Reduce the pixels of the video frame at time `t` over all segmentation labels at once, bypassing the cache (one row per label). """
+    with self.profiler.stage('color_statistics'):
+      unknown = set(statistics) - {'mean', 'std', 'min', 'max', 'median'}
+      if unknown:
+        raise ValueError(f'Unknown color statistics: {sorted(unknown)}')
+      flat_segmentations: np.ndarray = self.load_segmentations(t).ravel().astype(np.int64)
+      frame: np.ndarray = self.load_frame(t)
+      pixels: np.ndarray = frame.reshape(-1, frame.shape[-1]).astype(float)
+
+      # Sums over each label are accumulated with `np.bincount()`, which only needs a single pass over the frame.
+      counts = np.bincount(flat_segmentations)
+      labels = np.flatnonzero(counts)
+      data: Dict[str, np.ndarray] = {'count': counts[labels]}
+      for kk in range(pixels.shape[1]):
+        sums = np.bincount(flat_segmentations, weights=pixels[:, kk], minlength=len(counts))[labels]
+        mean = sums / counts[labels]
+        if 'mean' in statistics:
+          data[f'c{kk+1}_mean'] = mean
+        if 'std' in statistics:
+          squares = np.bincount(flat_segmentations, weights=pixels[:, kk]**2, minlength=len(counts))[labels]
+          data[f'c{kk+1}_std'] = np.sqrt(np.maximum(squares / counts[labels] - mean**2, 0.0))
+
+      # Order statistics are reduced over blocks of pixels sorted by label (and, for the median, by value within each label).
+      if {'min', 'max', 'median'} & set(statistics):
+        starts = np.concatenate(([0], np.cumsum(counts[labels])[:-1]))
+        for kk in range(pixels.shape[1]):
+          order = np.lexsort((pixels[:, kk], flat_segmentations))
+          values = pixels[order, kk]
+          if 'min' in statistics:
+            data[f'c{kk+1}_min'] = values[starts]
+          if 'max' in statistics:
+            data[f'c{kk+1}_max'] = values[starts + counts[labels] - 1]
+          if 'median' in statistics:
+            data[f'c{kk+1}_median'] = (values[starts + (counts[labels] - 1) // 2] + values[starts + counts[labels] // 2]) / 2
+      return pd.DataFrame(data, index=pd.Index(labels, name='label'))
+
+  def label_pixel_data(self, t: int, frame: np.ndarray, label: int) -> np.ndarray:
+    """ Return the pixels of the video frame at time `t` that belong to the segmentation `label`. """
+    cell: Dict = self.label_table(t).get(label)
+    if isinstance(cell, type(None)):
+      return frame[self.load_segmentations(t) == label]
+    return frame.reshape(-1, frame.shape[-1])[cell['pixels']]
+
   def cell_pixel_data(self, t: int, x0: float, y0: float) -> np.ndarray:
     """ Return the pixels belonging to the cell containing the point (x0,y0). """
-    segmentations: np.ndarray = self.load_segmentations(t)
-    frame: np.ndarray = self.load_frame(t)    
-    label = segmentations[int(y0), int(x0)]
-    object_mask = np.where(segmentations == label, True, False)
-    object_pixels = frame[object_mask]
-    return object_pixels
+    return self.label_pixel_data(t, self.load_frame(t), self.lookup_label(self.load_segmentations(t), x0, y0))
 
   def cell_avg_pixel_vector(self, t: int, x0: float, y0: float) -> np.ndarray:
-    """ Return the pixels belonging to the cell containing the point (x0,y0). """
-    return np.mean(self.cell_pixel_data(t, x0, y0), axis=1)
+    """ Return the average color (of each channel) of the pixels belonging to the cell containing the point (x0,y0). """
+    return np.mean(self.cell_pixel_data(t, x0, y0), axis=0)
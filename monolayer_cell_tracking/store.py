@@ -0,0 +1,67 @@
+
+import os
+import numpy as np
+from typing import Tuple
+
+class SegmentationStore():
+  def __init__(self, path: str, dtype: type = np.uint16) -> None:
+    """ This class stores the segmentation masks of every video frame in a single memory-mapped array on disk. """
+    self.path: str = path
+
+    # Data type of the masks; new stores are created with it, while existing stores keep the one recorded in their file header.
+    self.dtype: type = dtype
+    self.masks_file: str = os.path.join(path, 'masks.npy')
+    self.index_file: str = os.path.join(path, 'written.npy')
+
+    # Memory-mapped views of the store, opened on first use.
+    self.masks: np.memmap = None
+    self.written: np.memmap = None
+
+  def exists(self) -> bool:
+    """ Check whether the store has been created on disk. """
+    return os.path.exists(self.masks_file) and os.path.exists(self.index_file)
+
+  def create(self, num_frames: int, shape: Tuple[int, int], dtype: type = None) -> None:
+    """ Allocate space on disk for the segmentation masks of `num_frames` frames (of data type `dtype`, if given). """
+    os.makedirs(self.path, exist_ok=True)
+    self.dtype = self.dtype if isinstance(dtype, type(None)) else dtype
+    self.masks = np.lib.format.open_memmap(self.masks_file, mode='w+', dtype=self.dtype, shape=(num_frames, *shape))
+    self.written = np.lib.format.open_memmap(self.index_file, mode='w+', dtype=bool, shape=(num_frames,))
+    self.masks.flush()
+    self.written.flush()
+
+  def open(self) -> None:
+    """ Map the store into memory (data is only read from disk once it is accessed). """
+    if isinstance(self.masks, type(None)):
+      self.masks = np.load(self.masks_file, mmap_mode='r+')
+      self.written = np.load(self.index_file, mmap_mode='r+')
+      self.dtype = self.masks.dtype.type
+
+  def num_frames(self) -> int:
+    """ Number of frames that the store has space for. """
+    self.open()
+    return self.masks.shape[0]
+
+  def is_written(self, t: int) -> bool:
+    """ Check whether the segmentation masks of the frame at time `t` have been written to the store. """
+    if not self.exists():
+      return False
+    self.open()
+    return (0 <= t < len(self.written)) and bool(self.written[t])
+
+  def write(self, t: int, masks: np.ndarray) -> None:
+    """ Write the segmentation masks of the frame at time `t` to disk (the frame is only marked as written once its data is flushed). """
+    self.open()
+    if (np.iinfo(self.dtype).max < masks.max()):
+      raise ValueError(f'Segmentation label {masks.max()} does not fit in the store data type {np.dtype(self.dtype).name}.')
+    self.masks[t] = masks
+    self.masks.flush()
+    self.written[t] = True
+    self.written.flush()
+
+  def read(self, t: int) -> np.ndarray:
+    """ Return a (zero-copy, read-only) view of the segmentation masks of the frame at time `t`. """
+    self.open()
+    view = self.masks[t].view(np.ndarray)
+    view.flags.writeable = False
+    return view
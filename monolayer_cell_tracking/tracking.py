@@ -1,56 +1,142 @@
 
 import os
 import numpy as np
-import btrack, btrack.btypes
-from btrack import datasets # don't remove! import statement triggers required internal proccesses within `cell_config()`
-from typing import List
+from typing import TYPE_CHECKING, Dict, List
 from .segmentation import Segmentation
+from .manifest import digest, hash_file
+from .files import atomic_write
+if TYPE_CHECKING:
+  import btrack.btypes
+
+def cell_config() -> str:
+  """ Return the path of btrack's default cell configuration file. """
+  # Importing `btrack.datasets` fetches its registry of example files (and is required by `cell_config()`), so it is deferred until needed.
+  from btrack import datasets
+  return datasets.cell_config()
 
 class Tracking(Segmentation):
-  def __init__(self, src: str, model_path: str) -> None:
+  def __init__(self, src: str, model_path: str, tracking_window: int = 64, tracking_workers: int = 4, fast_start: bool = False, **kwargs) -> None:
     """ This class is used to track single cells across a time-series of segmentations. """
-    Segmentation.__init__(self, src, model_path)
+    Segmentation.__init__(self, src, model_path, **kwargs)
     self.trajectory_file = self.src.replace('.mp4', '.h5')
 
+    # Segmentations are converted into tracking objects `tracking_window` frames at a time, using `tracking_workers` processes.
+    self.tracking_window: int = tracking_window
+    self.tracking_workers: int = tracking_workers
+
+    # With `fast_start`, saved trajectories are loaded as they are, without hashing every frame to check that they are up to date.
+    self.fast_start: bool = fast_start
+
   def max_search_radius(self, scale: float = 1.0) -> float:
     """ Assume a maximum distance that each cell can travel between frames. """
-    return scale * self.model.diam_labels.copy()
+    return scale * self.cell_diameter()
+
+  def tracking_config(self) -> Dict:
+    """ Settings of the tracker, beyond those in btrack's default cell configuration file. """
+    return {
+      'max_search_radius': float(self.max_search_radius()),
+      'tracking_updates': ["MOTION", "VISUAL"],
+      'features': (
+        'area',
+        'major_axis_length',
+        'minor_axis_length',
+        'orientation',
+        'solidity')}
+
+  def tracking_inputs(self) -> str:
+    """ Hash the inputs that the trajectories are computed from (the inputs of every segmentation, and the tracker configuration). """
+    segmentation_inputs: List[str] = [self.segmentation_inputs(t) for t in range(self.num_frames())]
+    return digest(segmentation_inputs, hash_file(cell_config()), self.tracking_config())
+
+  def trajectories_digest(self) -> str:
+    """ Hash the saved trajectory data. """
+    return self.cache.get(('digest', 'trajectories'), lambda: hash_file(self.trajectory_file))
+
+  def objects_file(self, t0: int, t1: int) -> str:
+    """ Default naming convention for the tracking objects of the frames t0 <= t < t1. """
+    objects_dir = os.path.join(self.dst, 'objects')
+    os.makedirs(objects_dir, exist_ok=True)
+    return os.path.join(objects_dir, f't={t0}-{t1}.h5')
 
-  def extract_trajectories(self) -> List[btrack.btypes.Tracklet]:
+  def window_objects(self, frames: List[int]) -> List['btrack.btypes.PyTrackObject']:
+    """ Convert the segmentations of a window of consecutive frames into tracking objects, segmenting the frames first if needed. """
+    import btrack
+    (t0, t1) = (frames[0], frames[-1] + 1)
+    FEATURES = self.tracking_config()['features']
+    inputs: str = digest([self.segmentation_inputs(t) for t in frames], FEATURES)
+    if os.path.exists(self.objects_file(t0, t1)) and self.manifest.is_current('objects', f'{t0}-{t1}', inputs):
+      with btrack.io.HDF5FileHandler(self.objects_file(t0, t1), 'r', obj_type='obj_type_1') as reader:
+        return reader.objects
+
+    # Only this window's segmentations are held in memory at once.
+    if not all(self.is_segmented(t) for t in frames):
+      self.compute_segmentations(frames=frames)
+    timeseries: np.ndarray = np.stack([self.load_segmentations(t) for t in frames])
+    with self.profiler.stage('objects'):
+      objects = btrack.utils.segmentation_to_objects(
+        timeseries,
+        properties=FEATURES,
+        num_workers=self.tracking_workers)
+    for obj in objects:
+      obj.t = obj.t + t0
+
+    # Checkpoint the window's objects, so that an interrupted run can resume from the next window.
+    if objects:
+      with atomic_write(self.objects_file(t0, t1)) as tmp_file:
+        with btrack.io.HDF5FileHandler(tmp_file, 'w', obj_type='obj_type_1') as writer:
+          writer.write_objects(objects)
+      self.manifest.record('objects', f'{t0}-{t1}', inputs)
+      self.profiler.count('bytes_written', os.path.getsize(self.objects_file(t0, t1)))
+    return objects
+
+  def extract_trajectories(self) -> List['btrack.btypes.Tracklet']:
     """ Stitch a time-series of video frame segmentations together, and track individual cell trajectories. """
-    if os.path.exists(self.trajectory_file):
+    if os.path.exists(self.trajectory_file) and self.fast_start:
+      return self.load_trajectories()
+    import btrack
+    num_frames: int = self.num_frames()
+    if os.path.exists(self.trajectory_file) and (num_frames == 0):
+      # Without any video frames (e.g. only downloaded trajectories), there is nothing to check the saved trajectories against.
+      return self.load_trajectories()
+    inputs: str = self.tracking_inputs()
+    if os.path.exists(self.trajectory_file) and self.manifest.is_current('tracking', 'trajectories', inputs):
       return self.load_trajectories()
 
-    timeseries: List[np.ndarray] = [self.load_segmentations(t) for t in range(self.num_frames())]
+    # Segment and convert the frames in rolling windows; the tracker only keeps the (much smaller) objects.
+    window: int = self.tracking_window or num_frames
+    objects: List['btrack.btypes.PyTrackObject'] = []
+    for t0 in range(0, num_frames, window):
+      objects.extend(self.window_objects(list(range(t0, min(t0 + window, num_frames)))))
 
-    (ymax, xmax) = timeseries[0].shape
+    (ymax, xmax) = self.load_segmentations(0).shape
     (ymin, xmin) = (0, 0)
 
-    FEATURES = (
-        'area',
-        'major_axis_length',
-        'minor_axis_length',
-        'orientation',
-        'solidity')
-
-    objects = btrack.utils.segmentation_to_objects(
-      np.array(timeseries),
-      properties=FEATURES,
-      num_workers=4)
+    config: Dict = self.tracking_config()
+    FEATURES = config['features']
 
-    with btrack.BayesianTracker() as tracker:
-      tracker.configure(btrack.datasets.cell_config())
-      tracker.max_search_radius = self.max_search_radius()
-      tracker.tracking_updates = ["MOTION", "VISUAL"]
+    with self.profiler.stage('track'), btrack.BayesianTracker() as tracker:
+      tracker.configure(cell_config())
+      tracker.max_search_radius = config['max_search_radius']
+      tracker.tracking_updates = config['tracking_updates']
       tracker.features = FEATURES
       tracker.append(objects)
       tracker.volume=((xmin, xmax), (ymin, ymax))
       tracker.track()
       tracker.optimize()
-      tracker.export(self.trajectory_file, obj_type="obj_type_1")
+      # The saved trajectories are only replaced once the new ones have been written in full.
+      with atomic_write(self.trajectory_file) as tmp_file:
+        # btrack appends to an existing hdf5 file, so the (empty) placeholder is removed first.
+        os.remove(tmp_file)
+        tracker.export(tmp_file, obj_type="obj_type_1")
+    self.profiler.count('bytes_written', os.path.getsize(self.trajectory_file))
+    self.manifest.record('tracking', 'trajectories', inputs)
 
     return self.load_trajectories()
 
-  def load_trajectories(self) -> List[btrack.btypes.Tracklet]:
+  def load_trajectories(self) -> List['btrack.btypes.Tracklet']:
     """ Load the trajectory data saved by extract_trajectories(). """
-    return btrack.io.HDF5FileHandler(self.trajectory_file).tracks
+    import btrack
+    with self.profiler.stage('read_trajectories'):
+      tracks: List['btrack.btypes.Tracklet'] = btrack.io.HDF5FileHandler(self.trajectory_file).tracks
+    self.profiler.count('bytes_read', os.path.getsize(self.trajectory_file))
+    return tracks
@@ -1,16 +1,24 @@
 
-import os, btrack
+import os
 import numpy as np
 import pandas as pd
 from tqdm import tqdm
-from typing import Dict, List
+from typing import TYPE_CHECKING, Dict, Iterable, List, Tuple
 from .tracking import Tracking
+from .indexing import TrajectoryIndex, SpatialIndex
+from .export import ColumnarExport, write_table
+from .kinematics import VELOCITY_COLUMNS, LAG_COLUMNS, ORDER_COLUMNS, velocities, correlations, nematic_order
+from .contacts import ContactGraph, load_contact_graph
+from .manifest import digest
+if TYPE_CHECKING:
+  import btrack.btypes
 
 class Trajectories(Tracking):
-  def __init__(self, src: str, model_path: str):
+  def __init__(self, src: str, model_path: str, **kwargs):
     """ This class combines tracking and segmentation data to extract highly-detailed trajectory data. """
-    Tracking.__init__(self, src, model_path)
+    Tracking.__init__(self, src, model_path, **kwargs)
     self.trajectories = self.extract_trajectories()
+    self.index = TrajectoryIndex(self.trajectories)
     self.max_nNeigh: int = 12
 
   def num_cells(self) -> int:
@@ -19,41 +27,41 @@ class Trajectories(Tracking):
 
   def x(self, t: int, ii: int) -> int:
     """ Return the x-coordinate of the centroid of cell `ii` at time `t`. """
-    return int(self.trajectories[ii].x[self.trajectories[ii].t.index(t)])
+    return int(self.index.x[self.index.row(t, ii)])
 
   def y(self, t: int, ii: int) -> int:
     """ Return the y-coordinate of the centroid of cell `ii` at time `t`. """
-    return int(self.trajectories[ii].y[self.trajectories[ii].t.index(t)])
+    return int(self.index.y[self.index.row(t, ii)])
 
   def A(self, t: int, ii: int) -> int:
     """ Return the cross-sectional area of cell `ii` at time `t`. """
     try:
-      return int(self.trajectories[ii].properties['area'][self.trajectories[ii].t.index(t)])
+      return int(self.index.properties['area'][self.index.row(t, ii)])
     except ValueError:
       return -1
 
   def l1(self, t: int, ii: int) -> int:
     """ Return the major axis length of cell `ii` at time `t`. """
     try:
-      return int(self.trajectories[ii].properties['major_axis_length'][self.trajectories[ii].t.index(t)])
+      return int(self.index.properties['major_axis_length'][self.index.row(t, ii)])
     except ValueError:
       return -1
 
   def l2(self, t: int, ii: int) -> int:
     """ Return the minor axis length of cell `ii` at time `t`. """
     try:
-      return int(self.trajectories[ii].properties['minor_axis_length'][self.trajectories[ii].t.index(t)])
+      return int(self.index.properties['minor_axis_length'][self.index.row(t, ii)])
     except ValueError:
       return -1
 
   def theta(self, t: int, ii: int) -> float:
     """ Return the nematic angular orientation of cell `ii` at time `t`. """
-    return self.trajectories[ii].properties['orientation'][self.trajectories[ii].t.index(t)]
+    return self.index.properties['orientation'][self.index.row(t, ii)]
 
   def average_cell_size(self, t: int) -> float:
     """ Compute the characteristic length-scale of cells at time `t`. """
-    area_distribution = [self.A(t, ii) for ii, _ in self.instantaneous_trajectories(t).items() if not np.isnan(self.A(t, ii))]
-    return np.sqrt(np.mean(np.array(area_distribution)))
+    area_distribution = np.trunc(self.index.properties['area'][self.index.frame_rows(t)])
+    return np.sqrt(np.nanmean(area_distribution))
 
   def separation_distance(self, t: int, ii: int, jj: int) -> float:
     """ Compute the distance between two cells at time `t`. """
@@ -69,32 +77,29 @@ class Trajectories(Tracking):
       null_fields[f'num_contact_pnts_{jj}'] = []
     return null_fields
 
-  def instantaneous_trajectories(self, t: int) -> Dict[int, btrack.btypes.Tracklet]:
+  def instantaneous_trajectories(self, t: int) -> Dict[int, 'btrack.btypes.Tracklet']:
     """ Find the set of trajectories that exist at time `t`. """
-    return {ii: traj for ii, traj in enumerate(self.trajectories) if (t in traj.t)}
+    return {ii: self.trajectories[ii] for ii in self.index.cells(t).tolist()}
 
-  def subvolume_trajectories(self, t: int, window: List[int]) -> Dict[int, btrack.btypes.Tracklet]:
+  def subvolume_trajectories(self, t: int, window: List[int]) -> Dict[int, 'btrack.btypes.Tracklet']:
     """ Find the set of trajectories that exist at time `t` within a sub-volume `window`. """
-    def is_within_window(traj: btrack.btypes.Tracklet) -> bool:
-      x = traj.x[traj.t.index(t)]
-      y = traj.y[traj.t.index(t)]
-      is_within_y = (window[0] < y < window[1])
-      is_within_x = (window[2] < x < window[3])
-      return (is_within_x and is_within_y)
-    return {ii: traj for ii, traj in self.instantaneous_trajectories(t).items() if is_within_window(traj)}
+    return {ii: self.trajectories[ii] for ii in self.spatial_index(t).window(*window).tolist()}
+
+  def spatial_index(self, t: int) -> SpatialIndex:
+    """ Index the centroids of the cells at time `t` (and their characteristic length-scale) for fast spatial queries. """
+    return self.cache.get(('spatial', t), lambda: self.compute_spatial_index(t))
+
+  def compute_spatial_index(self, t: int) -> SpatialIndex:
+    """ Build the spatial index of the cells at time `t`, bypassing the cache. """
+    rows: np.ndarray = self.index.frame_rows(t)
+    return SpatialIndex(self.index.x[rows], self.index.y[rows], self.index.cell[rows], length=self.average_cell_size(t))
 
   def neighbor_candidates(self, t: int, ii: int) -> List[int]:
     """ Find the set of cells with centroids within a metric cut-off radius around cell `ii` at time `t`. """
-    metric_neighbors: List[int] = []
-    search_radius = 3.0 * self.average_cell_size(t)
-    for jj, _ in self.instantaneous_trajectories(t).items():
-      if (ii == jj):
-        continue
-      elif search_radius < self.separation_distance(t, ii, jj):
-        continue
-      else:
-        metric_neighbors.append(jj)
-    return metric_neighbors
+    spatial: SpatialIndex = self.spatial_index(t)
+    row: int = self.index.row(t, ii)
+    candidates: np.ndarray = spatial.radius(self.index.x[row], self.index.y[row], 3.0 * spatial.length)
+    return [jj for jj in candidates.tolist() if (ii != jj)]
 
   def are_neighbors(self, cell_1: Dict, cell_2: Dict) -> bool:
     """ Compare the contour coordinates of two cells to check whether they are in physical contact. """
@@ -106,65 +111,231 @@ class Trajectories(Tracking):
       dr = np.sqrt(dx**2 + dy**2)
       return np.any(dr <= 2.0)
 
+  def cell_labels(self, t: int) -> Dict[int, int]:
+    """ Find the segmentation label underneath the centroid of each cell at time `t` (background is labelled 0). """
+    return self.cache.get(('cell_labels', t), lambda: self.compute_cell_labels(t))
+
+  def compute_cell_labels(self, t: int) -> Dict[int, int]:
+    """ Look up the segmentation label underneath each cell's centroid at time `t`, bypassing the cache. """
+    segmentations: np.ndarray = self.load_segmentations(t)
+    rows: np.ndarray = self.index.frame_rows(t)
+    (x, y) = (self.index.x[rows], self.index.y[rows])
+    labels: np.ndarray = segmentations[y.astype(int), x.astype(int)]
+    cell_labels: Dict = {}
+    for ii, label, x0, y0 in zip(self.index.cell[rows].tolist(), labels.tolist(), x, y):
+      cell_labels[ii] = label if (label != 0) else self.lookup_label(segmentations, x0, y0)
+    return cell_labels
+
+  def label_cells(self, t: int) -> Dict[int, List[int]]:
+    """ Map each (non-background) segmentation label at time `t` to the cells whose centroid lies on it. """
+    return self.cache.get(('label_cells', t), lambda: self.compute_label_cells(t))
+
+  def compute_label_cells(self, t: int) -> Dict[int, List[int]]:
+    """ Invert `cell_labels()` at time `t`, bypassing the cache. """
+    label_cells: Dict[int, List[int]] = {}
+    for ii, label in self.cell_labels(t).items():
+      if (label != 0):
+        label_cells.setdefault(label, []).append(ii)
+    return label_cells
+
+  def contacts(self, t: int, ii: int) -> Dict[int, int]:
+    """ Map each cell in physical contact with cell `ii` at time `t` to the number of points along their shared edge. """
+    labels: Dict[int, int] = self.cell_labels(t)
+    if (labels[ii] == 0):
+      return {}
+    label_cells: Dict[int, List[int]] = self.label_cells(t)
+    contact_labels: Dict[int, int] = self.cell_contacts(t).get(labels[ii], {})
+    return dict(sorted((jj, num_contact_pnts) for label, num_contact_pnts in contact_labels.items() for jj in label_cells.get(label, ()) if (ii != jj)))
+
   def neighbors(self, t: int, ii: int) -> List[int]:
     """ Find the set of cells that are in physical contact with cell `ii`. """
-    neighbor_list: List[int] = []
-    cell_ii = self.lookup_cell_contour(t, self.x(t,ii), self.y(t,ii))
-    for jj in self.neighbor_candidates(t, ii):
-      cell_jj = self.lookup_cell_contour(t, self.x(t,jj), self.y(t,jj))
-      if self.are_neighbors(cell_ii, cell_jj):
-        neighbor_list.append(jj)
-    return neighbor_list
+    return list(self.contacts(t, ii).keys())
+
+  def frame_contacts(self, t: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ Return the (ii, jj, num_contact_pnts) arrays of every pair of cells in physical contact at time `t` (as in `contacts()`), sorted by (ii, jj). """
+    labels: Dict[int, int] = self.cell_labels(t)
+    cells = pd.DataFrame({'ii': list(labels.keys()), 'label': list(labels.values())})
+    cells = cells[cells['label'] != 0]
+    edges = pd.DataFrame(
+      [(label_1, label_2, num_contact_pnts) for label_1, contact_labels in self.cell_contacts(t).items() for label_2, num_contact_pnts in contact_labels.items()],
+      columns=['label_1', 'label_2', 'num_contact_pnts'])
+
+    # Cells sharing a label are not in contact with each other, but each is in contact with every cell of a contacting label.
+    edges = edges.merge(cells.rename(columns={'label': 'label_1'}), on='label_1')
+    edges = edges.merge(cells.rename(columns={'ii': 'jj', 'label': 'label_2'}), on='label_2')
+    edges = edges[edges['ii'] != edges['jj']].sort_values(['ii', 'jj'])
+    return edges['ii'].to_numpy(np.int64), edges['jj'].to_numpy(np.int64), edges['num_contact_pnts'].to_numpy(np.int64)
+
+  def contact_graph_file(self) -> str:
+    """ Default location of the saved contact graph. """
+    return os.path.join(self.dump_dir(), 'contacts.npz')
+
+  def contact_graph_inputs(self) -> str:
+    """ Hash the inputs that the contact graph is computed from (the trajectories, and the segmentations of every frame). """
+    return digest(self.trajectories_digest(), [self.masks_digest(t) for t in range(self.index.num_frames())])
+
+  def contact_graph(self) -> ContactGraph:
+    """ Return the cell-cell contacts of every frame, for queries over time (see `ContactGraph`). """
+    return self.cache.get(('contact_graph',), lambda: self.read_contact_graph())
+
+  def read_contact_graph(self) -> ContactGraph:
+    """ Read the saved contact graph from disk (computing and saving it first, if missing or stale), bypassing the cache. """
+    inputs: str = self.contact_graph_inputs()
+    if os.path.exists(self.contact_graph_file()) and self.manifest.is_current('contact_graph', 'graph', inputs):
+      return load_contact_graph(self.contact_graph_file())
+    graph: ContactGraph = self.compute_contact_graph()
+    graph.save(self.contact_graph_file())
+    self.manifest.record('contact_graph', 'graph', inputs)
+    self.profiler.count('bytes_written', os.path.getsize(self.contact_graph_file()))
+    return graph
+
+  def compute_contact_graph(self) -> ContactGraph:
+    """ Collect the cell-cell contacts of every frame into a contact graph, bypassing the cache and the saved graph. """
+    columns: Dict[str, List[np.ndarray]] = {'t': [], 'ii': [], 'jj': [], 'num_contact_pnts': []}
+    with self.profiler.stage('contact_graph'):
+      for t in tqdm(range(self.index.num_frames())):
+        (ii, jj, num_contact_pnts) = self.frame_contacts(t)
+        for name, value in (('t', np.full(len(ii), t, dtype=np.int64)), ('ii', ii), ('jj', jj), ('num_contact_pnts', num_contact_pnts)):
+          columns[name].append(value)
+    (t, ii, jj, num_contact_pnts) = (np.concatenate([np.zeros(0, dtype=np.int64)] + values) for values in columns.values())
+    return ContactGraph(t, ii, jj, num_contact_pnts, self.index.num_frames(), self.num_cells())
 
   def dump_dir(self) -> str:
     """ Default location where trajectory data will be dumped to. """
     out = self.dst.replace('frames', 'trajectories')
-    if not os.path.exists(out):
-      os.mkdir(out)
+    os.makedirs(out, exist_ok=True)
     return out
 
-  def dump_data(self, ii: int = -1) -> None:
-    """ Primary function of this class; saves the trajectory data of each cell to a csv file. """
-    iterator: any = [ii] if (0 <= ii) else range(self.num_cells())
-    out = self.dump_dir()
-    for ii in iterator:
-      traj_file = os.path.join(out, f'ii={ii}.csv')
-      if os.path.exists(traj_file):
-        continue
-      else:
-        data = self.null_trajectory_data()
+  def dump_file(self, ii: int) -> str:
+    """ Default naming convention for cell trajectory datafiles. """
+    return os.path.join(self.dump_dir(), f'ii={ii}.csv')
+
+  def frame_data(self, t: int, cells: List[int]) -> Dict[int, Dict]:
+    """ Compute the trajectory data of every cell in `cells` at time `t`, loading the frame's data only once. """
+    with self.profiler.stage('frame_data'):
+      table: Dict[int, Dict] = self.label_table(t)
+      labels: Dict[int, int] = self.cell_labels(t)
+      colors: pd.DataFrame = self.color_statistics(t)
+      colors: Dict[int, List[int]] = dict(zip(colors.index.tolist(), colors[['c1_mean', 'c2_mean', 'c3_mean']].to_numpy().astype(int).tolist()))
+      contacts: Dict[int, List[Tuple[int, int]]] = {}
+      for ii, jj, num_contact_pnts in zip(*(array.tolist() for array in self.frame_contacts(t))):
+        contacts.setdefault(ii, []).append((jj, num_contact_pnts))
+      rows: Dict[int, Dict] = {}
+      for ii in cells:
+        row = {'t': t, 'x': self.x(t, ii), 'y': self.y(t, ii), 'A': self.A(t, ii), 'l1': int(self.l1(t, ii)), 'l2': int(self.l2(t, ii)), 'theta': self.theta(t, ii)}
+        (row['c1'], row['c2'], row['c3']) = colors.get(labels[ii], (-1, -1, -1))
+        cell = table.get(labels[ii])
+        row['P'] = len(cell['x']) if not isinstance(cell, type(None)) else -1
+        row['contacts'] = contacts.get(ii, [])
+        rows[ii] = row
+      return rows
+
+  def hashed_frame_data(self, t: int, cells: List[int], digests: Dict[int, Tuple[str, str]]) -> Dict[int, Dict]:
+    """ Compute the trajectory data of `cells` at time `t`, hashing the frame's inputs first (so that they are only loaded once, for both). """
+    self.input_digests(t, digests)
+    return self.frame_data(t, cells)
+
+  def padded_row(self, row: Dict) -> Dict:
+    """ Flatten a row's contacts into the fixed `neigh_k` and `num_contact_pnts_k` columns of the csv files (padded with -1). """
+    padded_row: Dict = {field: value for field, value in row.items() if (field != 'contacts')}
+    contacts = row['contacts'][:self.max_nNeigh]
+    for kk in range(self.max_nNeigh):
+      (padded_row[f'neigh_{kk}'], padded_row[f'num_contact_pnts_{kk}']) = contacts[kk] if (kk < len(contacts)) else (-1, -1)
+    return padded_row
+
+  def input_digests(self, t: int, digests: Dict[int, Tuple[str, str]]) -> Tuple[str, str]:
+    """ Hash the video frame and segmentation masks at time `t`, unless they are already in `digests` (which holds them for one export). """
+    # Cached digests can be evicted by the frames' data, so each export keeps its own (and hashes each frame once, rather than once per cell).
+    if t not in digests:
+      digests[t] = (self.frame_digest(t), self.masks_digest(t))
+    return digests[t]
+
+  def export_inputs(self, ii: int, digests: Dict[int, Tuple[str, str]]) -> str:
+    """ Hash the inputs that the trajectory data of cell `ii` is computed from (the trajectories, and its frames and segmentations). """
+    frames: List[Tuple[str, str]] = [self.input_digests(t, digests) for t in self.trajectories[ii].t]
+    return digest(self.trajectories_digest(), self.max_nNeigh, [frame for (frame, masks) in frames], [masks for (frame, masks) in frames])
+
+  def pending_cells(self, ii: int = -1, format: str = 'csv', digests: Dict[int, Tuple[str, str]] = None) -> List[int]:
+    """ Find the cells (all of them, or only cell `ii`) whose trajectory data has not yet been saved from its current inputs. """
+    digests = {} if isinstance(digests, type(None)) else digests
+    if (format != 'csv') and (0 <= ii):
+      # Columnar tables hold every cell, so exporting a single cell would overwrite the full tables with that one cell.
+      raise ValueError(f'Columnar ({format}) export covers every cell; use format="csv" to export only cell {ii}')
+    iterator: List[int] = [ii] if (0 <= ii) else list(range(self.num_cells()))
+    if (format != 'csv'):
+      # Columnar tables are written in full, so either every cell is pending or none is.
+      is_saved: bool = os.path.exists(os.path.join(self.dump_dir(), f'cells.{format}'))
+      return [] if is_saved and self.manifest.is_current('export', format, self.columnar_inputs(iterator, digests)) else iterator
+    return [ii for ii in iterator if not (os.path.exists(self.dump_file(ii)) and self.manifest.is_current('export', ii, self.export_inputs(ii, digests)))]
+
+  def columnar_inputs(self, cells: List[int], digests: Dict[int, Tuple[str, str]]) -> str:
+    """ Hash the inputs that the columnar tables of `cells` are computed from. """
+    return digest(cells, [self.export_inputs(ii, digests) for ii in cells])
+
+  def frame_cells(self, cells: List[int]) -> Dict[int, List[int]]:
+    """ Group the cells by the frames they exist in, so that each frame only needs to be visited once. """
+    frame_cells: Dict[int, List[int]] = {}
+    for ii in cells:
       for t in self.trajectories[ii].t:
-        data['t'].append(t)
-        data['x'].append(self.x(t, ii))
-        data['y'].append(self.y(t, ii))
-        data['A'].append(self.A(t, ii))
-        data['l1'].append(int(self.l1(t, ii)))
-        data['l2'].append(int(self.l2(t, ii)))
-        data['theta'].append(self.theta(t, ii))
-        vec = self.cell_avg_pixel_vector(t, self.x(t,ii), self.y(t,ii))
-        data['c1'].append(int(vec[0]))
-        data['c2'].append(int(vec[1]))
-        data['c3'].append(int(vec[2]))
-        cell = self.lookup_cell_contour(t, self.x(t,ii), self.y(t,ii))
-        if not isinstance(cell, type(None)):
-          data['P'].append(len(cell['x']))
-        else:
-          data['P'].append(-1)
-        num_neighbors: int = 0
-        for jj in self.neighbor_candidates(t, ii):
-          if (ii == jj):
-            continue
-          else:
-            cell_1 = self.lookup_cell_contour(t, self.x(t,ii), self.y(t,ii))
-            cell_2 = self.lookup_cell_contour(t, self.x(t,jj), self.y(t,jj))
-          if self.are_neighbors(cell_1, cell_2):
-            connected_pnts: np.ndarray = self.shared_edge(cell_1, cell_2)
-            data[f'neigh_{num_neighbors}'].append(jj)
-            data[f'num_contact_pnts_{num_neighbors}'].append(connected_pnts.shape[0])
-            num_neighbors += 1
-        for jj in range(num_neighbors, self.max_nNeigh):
-          data[f'neigh_{num_neighbors}'].append(-1)
-          data[f'num_contact_pnts_{num_neighbors}'].append(-1)
-          num_neighbors += 1
-        df = pd.DataFrame(data)
-        df.to_csv(traj_file, index=False)
+        frame_cells.setdefault(t, []).append(ii)
+    return dict(sorted(frame_cells.items()))
+
+  def dump_frames(self, frames: Iterable[Tuple[int, Dict[int, Dict]]], cells: List[int], digests: Dict[int, Tuple[str, str]] = None) -> None:
+    """ Scatter the (time-ordered) data of each frame to the cells, and save each cell's data once its trajectory has ended. """
+    digests = {} if isinstance(digests, type(None)) else digests
+    data: Dict[int, Dict] = {ii: self.null_trajectory_data() for ii in cells}
+    for t, rows in frames:
+      for ii, row in rows.items():
+        for field, value in self.padded_row(row).items():
+          data[ii][field].append(value)
+        if (t == self.index.t_max[ii]):
+          with self.profiler.stage('export'):
+            pd.DataFrame(data.pop(ii)).to_csv(self.dump_file(ii), index=False)
+          self.manifest.record('export', ii, self.export_inputs(ii, digests))
+          self.profiler.count('bytes_written', os.path.getsize(self.dump_file(ii)))
+
+  def export_frames(self, frames: Iterable[Tuple[int, Dict[int, Dict]]], cells: List[int], format: str = 'parquet', digests: Dict[int, Tuple[str, str]] = None) -> None:
+    """ Stream the (time-ordered) data of each frame to a cell table and a long-format neighbor table (Parquet or Feather). """
+    digests = {} if isinstance(digests, type(None)) else digests
+    export = ColumnarExport(self.dump_dir(), format)
+    for t, rows in frames:
+      with self.profiler.stage('export'):
+        export.add_frame(t, rows)
+    with self.profiler.stage('export'):
+      export.close()
+    self.manifest.record('export', format, self.columnar_inputs(cells, digests))
+    self.profiler.count('bytes_written', os.path.getsize(export.cells_file) + os.path.getsize(export.neighbors_file))
+
+  def kinematics_files(self, format: str = 'parquet') -> Dict[str, str]:
+    """ Default locations of the velocity, (MSD and VACF) correlation and nematic order tables. """
+    return {name: os.path.join(self.dump_dir(), f'{name}.{format}') for name in ('velocities', 'correlations', 'order')}
+
+  def dump_kinematics(self, format: str = 'parquet', max_lag: int = None, batch_size: int = 1024) -> None:
+    """ Compute the kinematics of every cell together, and save them as columnar tables (skipped if already saved from the same inputs). """
+    assert format in ('parquet', 'feather')
+    files: Dict[str, str] = self.kinematics_files(format)
+    inputs: str = digest(self.trajectories_digest(), max_lag)
+    if all(os.path.exists(path) for path in files.values()) and self.manifest.is_current('kinematics', format, inputs):
+      return
+    with self.profiler.stage('kinematics'):
+      tables: Dict[str, Dict[str, np.ndarray]] = {
+        'velocities': velocities(self.index),
+        'correlations': correlations(self.index, max_lag=max_lag, batch_size=batch_size),
+        'order': nematic_order(self.index)}
+    with self.profiler.stage('export'):
+      for name, columns in (('velocities', VELOCITY_COLUMNS), ('correlations', LAG_COLUMNS), ('order', ORDER_COLUMNS)):
+        write_table(files[name], columns, tables[name], format)
+    self.manifest.record('kinematics', format, inputs)
+    self.profiler.count('bytes_written', sum(os.path.getsize(path) for path in files.values()))
+
+  def dump_data(self, ii: int = -1, format: str = 'csv') -> None:
+    """ Primary function of this class; saves the trajectory data of each cell to a csv file (or to 'parquet' or 'feather' tables). """
+    assert format in ('csv', 'parquet', 'feather')
+    digests: Dict[int, Tuple[str, str]] = {}
+    cells: List[int] = self.pending_cells(ii, format, digests)
+    frame_cells: Dict[int, List[int]] = self.frame_cells(cells)
+    frames = ((t, self.hashed_frame_data(t, frame_cells[t], digests)) for t in tqdm(frame_cells))
+    if (format == 'csv'):
+      self.dump_frames(frames, cells, digests)
+    else:
+      self.export_frames(frames, cells, format, digests)
@@ -1,31 +1,73 @@
 
-import os, cv2
+import os, cv2, glob, threading
 import numpy as np
-from typing import Tuple
+from typing import Dict, Tuple
+from .cache import LRUCache
+from .profiling import Profiler
+from .files import atomic_write, temporary_path
 
 class Video():
-  def __init__(self, src: str) -> None:
+  def __new__(cls, *args, **kwargs) -> 'Video':
+    """ Remember the arguments that the object is constructed with, so that worker processes can construct an identical copy. """
+    video = super().__new__(cls)
+    video.init_args: Tuple = args
+    video.init_kwargs: Dict = kwargs
+    return video
+
+  def __init__(self, src: str, frame_source: str = 'png', cache_size: int = 2**30, profile: bool = False) -> None:
     """ This class is used to handle video data. """
     assert os.path.exists(src)
+    assert frame_source in ('png', 'video', 'stack')
     self.src: str = src
     self.dst: str = self.config_frames_dir()
 
+    # Frames are served from extracted 'png' image files, decoded directly from the 'video', or read from a memory-mapped 'stack'.
+    self.frame_source: str = frame_source
+
+    # Recently used frames, masks and per-frame derived data, bounded to `cache_size` bytes in total.
+    self.cache = LRUCache(cache_size)
+
+    # Time spent in each stage of the pipeline, and bytes read and written (only recorded if `profile` is set).
+    self.profiler = Profiler(enabled=profile, cache=self.cache)
+
+    # The open video stream that frames are decoded from (for the 'video' source).
+    self.capture: cv2.VideoCapture = None
+    self.capture_pid: int = None
+    self.capture_position: int = -1
+
+    # The stream is not thread-safe (and is shared with background threads, e.g. the segmentation prefetcher), so it is only used under a lock.
+    self.capture_lock = threading.Lock()
+
+    # Memory-mapped array of video frames (for the 'stack' source), opened on first use.
+    self.frames: np.ndarray = None
+
+    # Number of frames that can be decoded from the src file (for the 'video' source), counted on first use.
+    self.frame_count: int = None
+
   def config_frames_dir(self) -> str:
     """ Create a directory (adjacent to the src file) in which to save video frame images. """
     src_file = os.path.basename(self.src)
     src_file_noExt = src_file.split('.')[0]
     src_dir = self.src.split(src_file)[0]
     dst_dir = (src_dir + f'{src_file_noExt}_frames')
-    if not os.path.exists(dst_dir):
-      os.mkdir(dst_dir)
+    os.makedirs(dst_dir, exist_ok=True)
     return dst_dir
 
   def frame_file(self, t: int) -> str:
     """ Default naming convention for video frame images files. """
     return os.path.join(self.dst, f't={t}.png')
 
+  def frame_stack_file(self) -> str:
+    """ Default naming convention for the memory-mapped array of video frames. """
+    return os.path.join(self.dst, 'frames.npy')
+
   def extract_frames(self) -> int:
     """ Iterate over each frame in the src file, and save each one as an image file (return total number of frames). """
+    if (self.frame_source == 'video'):
+      return self.num_frames()
+    elif (self.frame_source == 'stack'):
+      return self.extract_frame_stack()
+
     vid = cv2.VideoCapture(self.src)
     assert vid.isOpened()
 
@@ -36,24 +78,140 @@ class Video():
       ret, frame = vid.read()
       if not ret:
         break
-      elif os.path.exists(self.frame_file(t)):
-        continue
-      else:
+      elif not os.path.exists(self.frame_file(t)):
         cv2.imwrite(self.frame_file(t), frame)
       t +=1
 
     return t
 
+  def extract_frame_stack(self) -> int:
+    """ Save every frame in the src file (as rgb color channels) to a single memory-mapped array (return total number of frames). """
+    if os.path.exists(self.frame_stack_file()):
+      return self.num_frames()
+
+    vid = cv2.VideoCapture(self.src)
+    assert vid.isOpened()
+    metadata: Dict = self.video_metadata()
+
+    tmp_file = temporary_path(self.frame_stack_file())
+    try:
+      shape = (metadata['num_frames'], metadata['Ly'], metadata['Lx'], 3)
+      stack = np.lib.format.open_memmap(tmp_file, mode='w+', dtype=np.uint8, shape=shape)
+      t: int = 0
+      while (t < shape[0]):
+        ret, frame = vid.read()
+        if not ret:
+          break
+        stack[t] = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        t += 1
+      stack.flush()
+      if (t < shape[0]):
+        # The frame count in the metadata was an over-estimate, so trim the unused frames.
+        with atomic_write(self.frame_stack_file()) as trimmed_file:
+          np.save(trimmed_file, stack[:t])
+        del stack
+      else:
+        del stack
+        os.replace(tmp_file, self.frame_stack_file())
+    finally:
+      if os.path.exists(tmp_file):
+        os.remove(tmp_file)
+    return t
+
+  def video_metadata(self) -> Dict[str, int]:
+    """ Read the number of frames and the frame size from the src file's metadata (nothing is decoded). """
+    vid = cv2.VideoCapture(self.src)
+    assert vid.isOpened()
+    metadata = {
+      'num_frames': int(vid.get(cv2.CAP_PROP_FRAME_COUNT)),
+      'Lx': int(vid.get(cv2.CAP_PROP_FRAME_WIDTH)),
+      'Ly': int(vid.get(cv2.CAP_PROP_FRAME_HEIGHT))}
+    vid.release()
+    return metadata
+
+  def count_video_frames(self) -> int:
+    """ Count the frames that can actually be decoded from the src file (the frame count in its metadata is often only an estimate). """
+    num_frames: int = self.video_metadata()['num_frames']
+    vid = cv2.VideoCapture(self.src)
+    assert vid.isOpened()
+
+    # The metadata is trusted if its last frame can be decoded, and is the last one; otherwise every frame is counted.
+    vid.set(cv2.CAP_PROP_POS_FRAMES, max(num_frames - 1, 0))
+    if (0 < num_frames) and vid.grab() and not vid.grab():
+      vid.release()
+      return num_frames
+    vid.release()
+    vid = cv2.VideoCapture(self.src)
+    num_frames = 0
+    while vid.grab():
+      num_frames += 1
+    vid.release()
+    return num_frames
+
+  def frame_stack(self) -> np.ndarray:
+    """ Return a (read-only) view of the memory-mapped array of video frames, ordered as (t, y, x, rgb). """
+    if isinstance(self.frames, type(None)):
+      self.frames = np.asarray(np.load(self.frame_stack_file(), mmap_mode='r'))
+    return self.frames
+
+  def num_frames(self) -> int:
+    """ Count how many video frames there are. """
+    if (self.frame_source == 'video'):
+      if isinstance(self.frame_count, type(None)):
+        self.frame_count = self.count_video_frames()
+      return self.frame_count
+    elif (self.frame_source == 'stack'):
+      return self.frame_stack().shape[0]
+    return len(glob.glob(os.path.join(self.dst, '*.png')))
+
   def load_image(self, filepath: str) -> np.ndarray:
     """ Load an arbitrary image file (convert from bgr to rgb color channels). """
     return cv2.cvtColor(cv2.imread(filepath), cv2.COLOR_BGR2RGB)
 
+  def decode_frame(self, t: int) -> np.ndarray:
+    """ Decode the video frame at time `t` directly from the src file (convert from bgr to rgb color channels). """
+    with self.capture_lock:
+      # Each process needs its own video stream, since a forked stream would share its file offset with the parent's.
+      if isinstance(self.capture, type(None)) or (self.capture_pid != os.getpid()):
+        self.capture = cv2.VideoCapture(self.src)
+        self.capture_pid = os.getpid()
+        self.capture_position = 0
+      if (t != self.capture_position):
+        self.capture.set(cv2.CAP_PROP_POS_FRAMES, t)
+      ret, frame = self.capture.read()
+      if not ret:
+        raise IndexError(f'Unable to decode frame {t} of {self.src} ({self.num_frames()} frames can be decoded)')
+      self.capture_position = t + 1
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
   def load_frame(self, t: int) -> np.ndarray:
-    """ Load the image data of a video frame at time `t`. """
-    return self.load_image(self.frame_file(t))
+    """ Load the image data of a video frame at time `t` (frames are cached, so they are read-only). """
+    return self.cache.get(('frame', t), lambda: self.read_frame(t))
+
+  def read_frame(self, t: int) -> np.ndarray:
+    """ Read the image data of a video frame at time `t` from its source, bypassing the cache. """
+    with self.profiler.stage('decode'):
+      if (self.frame_source == 'stack'):
+        frame: np.ndarray = self.frame_stack()[t]
+        nbytes: int = frame.nbytes
+      elif (self.frame_source == 'video'):
+        frame: np.ndarray = self.decode_frame(t)
+        nbytes: int = frame.nbytes
+      else:
+        frame: np.ndarray = self.load_image(self.frame_file(t))
+        nbytes: int = os.path.getsize(self.frame_file(t))
+      frame.flags.writeable = False
+    self.profiler.count('bytes_read', nbytes)
+    return frame
 
   def system_size(self) -> Tuple[float]:
     """ Return the linear size of the video window. """
+    if (self.frame_source == 'video'):
+      metadata: Dict = self.video_metadata()
+      return (metadata['Lx'], metadata['Ly'])
+    elif (self.frame_source == 'stack'):
+      (T, Ly, Lx, Lz) = self.frame_stack().shape
+      return (Lx, Ly)
     frame = self.load_frame(t=0)
     (Ly, Lx, Lz) = frame.shape
     return (Lx, Ly)
@@ -2,93 +2,142 @@
 import os
 import itertools
 import numpy as np
-from typing import List
+from typing import TYPE_CHECKING, Iterator, List, Tuple
 from tqdm import tqdm
-import imageio.v2 as imageio
-import matplotlib
-import matplotlib.pyplot as plt
+from . import parallel
 from .trajectories import Trajectories
+from .writer import AnimationWriter, figure_to_array
+if TYPE_CHECKING:
+  import matplotlib.axes
 
 class Visualization(Trajectories):
-  def __init__(self, src: str, model_path: str):
+  def __init__(self, src: str, model_path: str, **kwargs):
     """ This class is used to overlay extracted trajectories and segmentations on raw experimental data. """
-    Trajectories.__init__(self, src, model_path)
+    Trajectories.__init__(self, src, model_path, **kwargs)
 
     self.cmaps = self.generate_colormaps()
 
-  def overlay_segmentations(self, t: int) -> np.ndarray:
-    """ Overlay the contours of segmented cells at time `t` on top of original video frame. """
-    frame: np.ndarray = self.load_frame(t)
-    for cell in self.cell_contours(t).values():
-      for x, y in zip(cell['x'], cell['y']):
-        frame[y,x] = np.array((255, 255, 255))
+  def zoom_window(self, t: int, zoom: List = None) -> Tuple[slice, slice]:
+    """ Convert a (y0, y1, x0, x1) zoom window into slices of the frame at time `t` (the whole frame if no zoom is given). """
+    (Ly, Lx) = self.load_segmentations(t).shape
+    if isinstance(zoom, type(None)):
+      return (slice(0, Ly), slice(0, Lx))
+    (y0, y1, x0, x1) = (int(z) for z in zoom)
+    return (slice(min(max(y0, 0), Ly), min(max(y1, 0), Ly)), slice(min(max(x0, 0), Lx), min(max(x1, 0), Lx)))
+
+  def window_neighbors(self, t: int, window: Tuple[slice, slice]) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """ Return the segmentations inside a window, and those of their 4 nearest neighbor pixels (0 beyond the edge of the frame). """
+    segmentations: np.ndarray = self.load_segmentations(t)
+    (ys, xs) = window
+
+    # Crop to the window plus a 1 pixel margin, so that pixels on the edge of the window are compared with their true neighbors.
+    (ya, yb, xa, xb) = (max(ys.start - 1, 0), min(ys.stop + 1, segmentations.shape[0]), max(xs.start - 1, 0), min(xs.stop + 1, segmentations.shape[1]))
+    padded = np.pad(segmentations[ya:yb, xa:xb], 1)
+    (y0, x0) = (ys.start - ya + 1, xs.start - xa + 1)
+    (Ny, Nx) = (ys.stop - ys.start, xs.stop - xs.start)
+    center = padded[y0:y0+Ny, x0:x0+Nx]
+    neighbors = [padded[y0+dy:y0+dy+Ny, x0+dx:x0+dx+Nx] for (dy, dx) in ((-1, 0), (1, 0), (0, -1), (0, 1))]
+    return center, neighbors
+
+  def boundary_pixels(self, t: int, window: Tuple[slice, slice]) -> np.ndarray:
+    """ Find the pixels of each cell (inside a window) that touch another label or the background. """
+    (center, neighbors) = self.window_neighbors(t, window)
+    boundary = np.zeros(center.shape, dtype=bool)
+    for neighbor in neighbors:
+      boundary |= (center != neighbor)
+    return boundary & (center != 0)
+
+  def contact_pixels(self, t: int, window: Tuple[slice, slice]) -> np.ndarray:
+    """ Find the pixels of each tracked cell (inside a window) that are in direct contact with another tracked cell. """
+    (center, neighbors) = self.window_neighbors(t, window)
+    tracked_labels = np.array([label for label in self.cell_labels(t).values() if (label != 0)], dtype=center.dtype)
+    contact = np.zeros(center.shape, dtype=bool)
+    for neighbor in neighbors:
+      contact |= (center != neighbor) & np.isin(neighbor, tracked_labels)
+    return contact & np.isin(center, tracked_labels)
+
+  def overlay_segmentations(self, t: int, zoom: List = None) -> np.ndarray:
+    """ Overlay the contours of segmented cells at time `t` on top of original video frame (cropped to the `zoom` window, if given). """
+    window: Tuple[slice, slice] = self.zoom_window(t, zoom)
+    frame: np.ndarray = self.load_frame(t)[window].copy()
+    frame[self.boundary_pixels(t, window)] = (255, 255, 255)
     return frame
 
   def highlight_shared_edges(self, frame: np.ndarray, t: int, zoom: List[int]) -> np.ndarray:
-    """ Color the portions of cell contours that are shared by two different cells. """
-    for ii, _ in tqdm(self.subvolume_trajectories(t, zoom).items()):
-      for jj in tqdm(self.neighbor_candidates(t, ii)):
-        if (ii == jj):
-          continue
-        else:
-          cell_1 = self.lookup_cell_contour(t, self.x(t,ii), self.y(t,ii))
-          cell_2 = self.lookup_cell_contour(t, self.x(t,jj), self.y(t,jj))
-        if self.are_neighbors(cell_1, cell_2):
-          for pnt in self.shared_edge(cell_1, cell_2):
-            frame[pnt[1], pnt[0]] = np.array((0, 255, 0))
+    """ Color the portions of cell contours (inside the `zoom` window) that are shared by two different cells. """
+    # `frame` is either the whole video frame, or already cropped to the `zoom` window (as returned by `overlay_segmentations(t, zoom)`).
+    window: Tuple[slice, slice] = self.zoom_window(t, zoom)
+    contact: np.ndarray = self.contact_pixels(t, window)
+    if (frame.shape[:2] == contact.shape):
+      frame[contact] = (0, 255, 0)
+    elif (frame.shape[:2] == self.load_segmentations(t).shape):
+      frame[window][contact] = (0, 255, 0)
+    else:
+      raise ValueError(f'Frame of shape {frame.shape[:2]} is neither the whole frame nor cropped to the zoom window {zoom}')
     return frame
 
-  def animate_raw_data(self, t0: int, tf: int, dst: str, zoom: List = None) -> None:
+  def raw_data_frame(self, t: int, zoom: List = None) -> np.ndarray:
+    """ Render a frame of the raw data movie. """
+    return self.load_frame(t)[self.zoom_window(t, zoom)]
+
+  def segmentations_frame(self, t: int, zoom: List = None) -> np.ndarray:
+    """ Render a frame of the cell segmentations movie. """
+    return self.overlay_segmentations(t, zoom)
+
+  def contact_points_frame(self, t: int, zoom: List[int]) -> np.ndarray:
+    """ Render a frame of the cell contact points movie. """
+    frame = self.overlay_segmentations(t, zoom)
+    return self.highlight_shared_edges(frame, t, zoom)
+
+  def render_frames(self, method: str, frames: List[int], num_workers: int = 1, **kwargs) -> Iterator[np.ndarray]:
+    """ Render the movie `frames` with `self.<method>(t, **kwargs)`, in order (optionally across `num_workers` processes). """
+    if (1 < num_workers):
+      return parallel.render_frames(self, method, frames, num_workers, **kwargs)
+    return (self.render_frame(method, t, **kwargs) for t in frames)
+
+  def render_frame(self, method: str, t: int, **kwargs) -> np.ndarray:
+    """ Render the movie frame at time `t` with `self.<method>(t, **kwargs)`. """
+    with self.profiler.stage('render'):
+      return getattr(self, method)(t, **kwargs)
+
+  def write_movie(self, dst: str, frames: Iterator[np.ndarray], num_frames: int, fps: float = 10) -> None:
+    """ Stream rendered frames to the movie file `dst`. """
+    with AnimationWriter(dst, fps=fps) as writer:
+      for frame in tqdm(frames, total=num_frames):
+        with self.profiler.stage('encode'):
+          writer.append(frame)
+    self.profiler.count('bytes_written', os.path.getsize(dst))
+
+  def animate_raw_data(self, t0: int, tf: int, dst: str, zoom: List = None, num_workers: int = 1) -> None:
     """ Create a movie of cell segmentations evolving over time. """
     if os.path.exists(dst):
       return None
     else:
       print(f'Creating file: {dst}')
-      animation = []
-      for t in tqdm(range(t0, tf)):
-        frame = self.load_frame(t)
-        if not isinstance(zoom, type(None)):
-          frame = frame[zoom[0]:zoom[1], zoom[2]:zoom[3], :]
-        animation.append(frame)
-      imageio.mimsave(dst, animation, fps=10, format='GIF', loop=0)
-
-  def animate_segmentations(self, t0: int, tf: int, dst: str, zoom: List = None) -> None:
+      self.write_movie(dst, self.render_frames('raw_data_frame', range(t0, tf), num_workers, zoom=zoom), tf-t0, fps=10)
+
+  def animate_segmentations(self, t0: int, tf: int, dst: str, zoom: List = None, num_workers: int = 1) -> None:
     """ Create a movie of cell segmentations evolving over time. """
     if os.path.exists(dst):
       return None
     else:
       print(f'Creating file: {dst}')
-      animation = []
-      for t in tqdm(range(t0, tf)):
-        frame = self.overlay_segmentations(t)
-        if not isinstance(zoom, type(None)):
-          frame = frame[zoom[0]:zoom[1], zoom[2]:zoom[3], :]
-        animation.append(frame)
-      imageio.mimsave(dst, animation, fps=10, format='GIF', loop=0)
-
-  def animate_contact_points(self, t0: int, tf: int, dst: str, zoom: List[int]) -> None:
+      self.write_movie(dst, self.render_frames('segmentations_frame', range(t0, tf), num_workers, zoom=zoom), tf-t0, fps=10)
+
+  def animate_contact_points(self, t0: int, tf: int, dst: str, zoom: List[int], num_workers: int = 1) -> None:
     """ Create a movie of cell segmentations evolving over time. """
     if os.path.exists(dst):
       return None
     else:
       print(f'Creating file: {dst}')
-      animation = []
-      for t in tqdm(range(t0, tf)):
-        frame = self.overlay_segmentations(t)
-        frame = self.highlight_shared_edges(frame, t, zoom)
-        frame = frame[zoom[0]:zoom[1], zoom[2]:zoom[3], :]
-        import cv2; cv2.imwrite('./tmp.png', frame)
-        animation.append(frame)
-        if (t-t0) % 5 == 0:
-          imageio.mimsave(dst, animation, fps=5, format='GIF', loop=0)
-      imageio.mimsave(dst, animation, fps=5, format='GIF', loop=0)
+      self.write_movie(dst, self.render_frames('contact_points_frame', range(t0, tf), num_workers, zoom=zoom), tf-t0, fps=5)
 
   def generate_colormaps(self) -> List[str]:
     """ Assign a colormap to each tracked cell. """
     cmap_options = itertools.cycle(['Greys', 'Purples', 'Oranges', 'Reds', 'Blues', 'Greens'])
     return [next(cmap_options) for _ in range(len(self.trajectories))]
 
-  def overlay_trajectories(self, ax: matplotlib.axes, t: int, zoom: List[int], s: float, trail_length=9) -> matplotlib.axes:
+  def overlay_trajectories(self, ax: 'matplotlib.axes.Axes', t: int, zoom: List[int], s: float, trail_length=9) -> 'matplotlib.axes.Axes':
     """ Plot the center-of-mass trajectory of each cell within a sub-volume window. """
     for ii, traj in self.subvolume_trajectories(t, zoom).items():
       tf = traj.t.index(t)
@@ -99,39 +148,35 @@ class Visualization(Trajectories):
       ax.scatter(xarr, yarr, c=tarr, cmap=self.cmaps[ii], s=s, marker='o')
     return ax
 
-  def animate_repo_main_mov(self, t0: int, tf: int, dst: str, dpi: int=50, dL0: int=100, rate: float=3.5) -> None:
+  def repo_main_mov_frame(self, t: int, t0: int, dpi: int = 50, dL0: int = 100, rate: float = 3.5) -> np.ndarray:
+    """ Render a frame of the repository's main movie (rendered straight from the figure's canvas). """
+    import matplotlib.pyplot as plt
+    (Lx, Ly) = self.system_size()
+    fig, ax = plt.subplots(figsize=(9.0, 9.0), dpi=dpi)
+    fig.subplots_adjust(left=0, right=1, bottom=0, top=1)
+    if 20 < (t - t0):
+      ax.imshow(self.overlay_segmentations(t))
+    else:
+      ax.imshow(self.load_frame(t))
+    if 30 < (t - t0):
+      s = 100 - 0.3 * (t-t0)
+    else:
+      s = 1e-2
+    dL = dL0 + rate * (t-t0)
+    x1 = (Lx / 2) - (dL / 2)
+    x2 = (Lx / 2) + (dL / 2)
+    y1 = (Ly / 2) - (dL / 2)
+    y2 = (Ly / 2) + (dL / 2)
+    ax = self.overlay_trajectories(ax, t, zoom=[y1, y2, x1, x2], s=s)
+    ax.set(xlim=[x1,x2], ylim=[y1,y2])
+    ax.set_axis_off()
+    frame = figure_to_array(fig)
+    plt.close(fig)
+    return frame
+
+  def animate_repo_main_mov(self, t0: int, tf: int, dst: str, dpi: int=50, dL0: int=100, rate: float=3.5, num_workers: int = 1) -> None:
     """ Make a pretty movie for the repsitory's root README. """
     if os.path.exists(dst):
       return None
     print(f'Creating file: {dst}')
-    (Lx, Ly) = self.system_size()
-    animation: List[np.ndarray] = []
-    for t in tqdm(range(t0, tf)):
-      fig, ax = plt.subplots(figsize=(9.0, 9.0))
-      if 20 < (t - t0):
-        ax.imshow(self.overlay_segmentations(t))
-      else:
-        ax.imshow(self.load_frame(t))
-      if 30 < (t - t0):
-        s = 100 - 0.3 * (t-t0)
-      else:
-        s = 1e-2
-      dL = dL0 + rate * (t-t0)
-      x1 = (Lx / 2) - (dL / 2)
-      x2 = (Lx / 2) + (dL / 2)
-      y1 = (Ly / 2) - (dL / 2)
-      y2 = (Ly / 2) + (dL / 2)
-      ax = self.overlay_trajectories(ax, t, zoom=[y1, y2, x1, x2], s=s)
-      ax.set(xlim=[x1,x2], ylim=[y1,y2])
-      ax.set_axis_off()
-      plt.savefig('./tmp.png', bbox_inches='tight', dpi=dpi)
-      frame = self.load_image('./tmp.png')
-      os.remove('./tmp.png')
-      plt.close()
-      if (t == t0):
-        animation.append(frame)
-      elif (t > t0) and (frame.shape == animation[-1].shape):
-        animation.append(frame)
-      else:
-        break
-    imageio.mimsave(dst, animation, fps=10, format='GIF', loop=0)
+    self.write_movie(dst, self.render_frames('repo_main_mov_frame', range(t0, tf), num_workers, t0=t0, dpi=dpi, dL0=dL0, rate=rate), tf-t0, fps=10)
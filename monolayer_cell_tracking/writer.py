@@ -0,0 +1,74 @@
+
+import os, cv2
+import numpy as np
+from typing import TYPE_CHECKING
+from PIL import Image, GifImagePlugin
+from .files import temporary_path
+if TYPE_CHECKING:
+  import matplotlib.figure
+
+def figure_to_array(fig: 'matplotlib.figure.Figure') -> np.ndarray:
+  """ Render a matplotlib figure straight from its canvas buffer, as an rgb image. """
+  fig.canvas.draw()
+  return np.asarray(fig.canvas.buffer_rgba())[..., :3].copy()
+
+class AnimationWriter():
+  def __init__(self, dst: str, fps: float = 10) -> None:
+    """ This class appends frames to a GIF or MP4 movie as they are produced, so that the movie is never held in memory. """
+    ext = os.path.splitext(dst)[1]
+    assert ext.lower() in ('.gif', '.mp4')
+    self.dst: str = dst
+    self.fps: float = fps
+    self.format: str = ext.lower()[1:]
+    self.num_frames: int = 0
+    self.shape: tuple = None
+
+    # Frames are written to a temporary file next to `dst`, which is only moved into place once the movie is complete.
+    self.tmp_dst: str = temporary_path(dst)
+    self.file = None
+    self.video: cv2.VideoWriter = None
+
+  def __enter__(self) -> 'AnimationWriter':
+    return self
+
+  def __exit__(self, exc_type: type, exc_value: Exception, traceback: any) -> None:
+    self.close(discard=not isinstance(exc_type, type(None)))
+
+  def append(self, frame: np.ndarray) -> None:
+    """ Append an rgb frame to the movie (every frame must have the same size as the first). """
+    frame = np.ascontiguousarray(frame, dtype=np.uint8)
+    if isinstance(self.shape, type(None)):
+      self.shape = frame.shape
+    elif (frame.shape != self.shape):
+      raise ValueError(f'Frame of shape {frame.shape} does not match the movie\'s frame shape {self.shape}.')
+
+    if (self.format == 'gif'):
+      # Each frame is encoded with its own (local) color palette, and written out immediately.
+      im = Image.fromarray(frame).convert('P', palette=Image.Palette.ADAPTIVE)
+      if isinstance(self.file, type(None)):
+        self.file = open(self.tmp_dst, 'wb')
+        for block in GifImagePlugin.getheader(im, info={'loop': 0})[0]:
+          self.file.write(block)
+      for block in GifImagePlugin.getdata(im, duration=int(1000 / self.fps), include_color_table=True):
+        self.file.write(block)
+    else:
+      if isinstance(self.video, type(None)):
+        (Ly, Lx) = frame.shape[:2]
+        self.video = cv2.VideoWriter(self.tmp_dst, cv2.VideoWriter_fourcc(*'mp4v'), self.fps, (Lx, Ly))
+      self.video.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+    self.num_frames += 1
+
+  def close(self, discard: bool = False) -> None:
+    """ Finish the movie and move it into place (or, if `discard`, delete the unfinished movie). """
+    if not isinstance(self.file, type(None)):
+      self.file.write(b';')
+      self.file.close()
+      self.file = None
+    if not isinstance(self.video, type(None)):
+      self.video.release()
+      self.video = None
+    if os.path.exists(self.tmp_dst):
+      if discard or (self.num_frames == 0):
+        os.remove(self.tmp_dst)
+      else:
+        os.replace(self.tmp_dst, self.dst)
@@ -1,12 +1,13 @@
 from monolayer_cell_tracking.trajectories import Trajectories
+from monolayer_cell_tracking.parallel import parallel_dump_data
 
-def main(ii: int) -> None:
+def main(num_workers: int) -> None:
   trajectories = Trajectories(
     src='./monolayer_cell_tracking/data/Yamada.mp4',
     model_path='./monolayer_cell_tracking/models/cellpose_segmentation_model_Yamada')
 
-  trajectories.dump_data(ii)
+  parallel_dump_data(trajectories, num_workers=num_workers, shard_by='frames')
 
 import sys
 if __name__=="__main__":
-  main(ii=int(sys.argv[1]))
+  main(num_workers=int(sys.argv[1]) if (1 < len(sys.argv)) else None)
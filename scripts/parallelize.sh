@@ -1,4 +1,5 @@
 #!/bin/bash
-for ii in $(seq 2 5); do
-  nohup python3.9 parallelize.py $ii &
-done
+python3.9 -m monolayer_cell_tracking.parallel \
+  ./monolayer_cell_tracking/data/Yamada.mp4 \
+  ./monolayer_cell_tracking/models/cellpose_segmentation_model_Yamada \
+  --workers $(nproc) --shard-by frames
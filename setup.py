@@ -11,15 +11,23 @@ setup(
     install_requires=[
         "btrack",
         "numpy",
+        "scipy",
         "pandas",
         "tqdm",
-        "imageio",
+        "pillow",
         "matplotlib",
         "cellpose",
-        "shapely",
         "opencv-python",
         "gdown"
     ],
+    extras_require={
+        "columnar": ["pyarrow"],
+    },
+    entry_points={
+        "console_scripts": [
+            "monolayer-cell-tracking-parallel=monolayer_cell_tracking.parallel:main",
+        ],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
@@ -1,5 +1,8 @@
 import pytest
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from monolayer_cell_tracking.video import Video
+from benchmarks.synthetic import SyntheticMonolayer
 
 def test_video_Yamada():
   video = Video(src='./monolayer_cell_tracking/data/Yamada.mp4')
@@ -13,3 +16,26 @@ def test_video_Angelini():
   video = Video(src='./monolayer_cell_tracking/data/Angelini.mp4')
   video.extract_frames()
 
+
+def test_video_threaded_decoding(tmp_path):
+  # Threads share the video stream, so each decode (seek and read) must not interleave with another's.
+  (src, _) = SyntheticMonolayer(num_cells=40, size=128, num_frames=12).write(str(tmp_path))
+  video = Video(src=src, frame_source='video')
+  frames = [video.decode_frame(t) for t in range(video.num_frames())]
+  order = np.random.default_rng(0).integers(0, len(frames), 400).tolist()
+  with ThreadPoolExecutor(max_workers=4) as executor:
+    for t, frame in zip(order, executor.map(video.decode_frame, order)):
+      assert np.array_equal(frame, frames[t])
+
+@pytest.mark.parametrize('reported', [0, 7, 12, 20])
+def test_video_frame_count(tmp_path, monkeypatch, reported):
+  # The frame count in the video's metadata may be wrong (it is often estimated from the duration), so it is checked by decoding.
+  (src, _) = SyntheticMonolayer(num_cells=40, size=128, num_frames=12).write(str(tmp_path))
+  video = Video(src=src, frame_source='video')
+  metadata = video.video_metadata()
+  monkeypatch.setattr(video, 'video_metadata', lambda: {**metadata, 'num_frames': reported})
+  assert video.num_frames() == 12
+  monkeypatch.setattr(video, 'count_video_frames', lambda: pytest.fail('frames counted twice'))
+  assert video.num_frames() == 12
+  with pytest.raises(IndexError, match='12 frames'):
+    video.decode_frame(12)
@@ -1,5 +1,7 @@
 import pytest
+from collections import Counter
 from monolayer_cell_tracking.trajectories import Trajectories
+from benchmarks.synthetic import SyntheticMonolayer, SyntheticVisualization
 
 def test_trajectories_Angelini():
   trajectories = Trajectories(
@@ -7,3 +9,19 @@ def test_trajectories_Angelini():
     model_path='./monolayer_cell_tracking/models/cellpose_segmentation_model_Angelini')
 
   trajectories.dump_data()
+
+def test_export_decodes_each_frame_once(tmp_path, monkeypatch):
+  # The movie is larger than the cache, so digests cached alongside the frames would be evicted (and recomputed for every cell).
+  monolayer = SyntheticMonolayer(num_cells=60, size=128, num_frames=40)
+  (src, model_path) = monolayer.write(str(tmp_path))
+  visualization = SyntheticVisualization(monolayer, src, model_path, frame_source='video', cache_size=2**19)
+  for format in ('csv', 'parquet'):
+    # The first run exports every cell, and the second finds them all up to date.
+    for run in range(2):
+      visualization.cache.clear()
+      decoded = Counter()
+      read_frame = visualization.read_frame
+      monkeypatch.setattr(visualization, 'read_frame', lambda t: decoded.update([t]) or read_frame(t))
+      visualization.dump_data(format=format)
+      monkeypatch.undo()
+      assert decoded == Counter(range(monolayer.num_frames))
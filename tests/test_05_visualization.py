@@ -1,5 +1,8 @@
 import pytest
+import numpy as np
+from scipy import ndimage
 from monolayer_cell_tracking.visualization import Visualization
+from benchmarks.synthetic import SyntheticMonolayer, SyntheticVisualization
 
 def test_visualization_Yamada(keep_dir='./tests/keep', region = [150,250,150,250]):
 
@@ -30,3 +33,24 @@ def test_visualization_Pertz(keep_dir='./tests/keep', region = [150,250,350,450]
 #  visualization.animate_segmentations(t0=800, tf=1200, dst=f'{keep_dir}/angelini_animate_segmentations.gif', zoom=[600,800,600,800])
 #  visualization.animate_contact_points(t0=1000, tf=1020, dst=f'{keep_dir}/angelini_animate_contact_points.gif', zoom=[650,750,650,750])
 #  visualization.animate_repo_main_mov(t0=300, tf=550, dst=f'{keep_dir}/angelini_animate_repo_main_mov.gif')
+
+def test_highlight_shared_edges_window(tmp_path, monkeypatch, zoom=[40, 100, 30, 90]):
+  monolayer = SyntheticMonolayer(num_cells=40, size=128, num_frames=2)
+  (src, model_path) = monolayer.write(str(tmp_path))
+  visualization = SyntheticVisualization(monolayer, src, model_path)
+
+  # Fill in the membranes between the synthetic cells (with the nearest label), so that the cells are in direct contact.
+  masks = monolayer.masks(0)
+  nearest = ndimage.distance_transform_edt(masks == 0, return_distances=False, return_indices=True)
+  monkeypatch.setattr(visualization, 'load_segmentations', lambda t: masks[tuple(nearest)])
+  visualization.cache.clear()
+
+  # The whole frame and the frame cropped to the zoom window are highlighted alike.
+  window = visualization.zoom_window(0, zoom)
+  whole = visualization.highlight_shared_edges(np.zeros((128, 128, 3), dtype=np.uint8), 0, zoom)
+  cropped = visualization.highlight_shared_edges(np.zeros((60, 60, 3), dtype=np.uint8), 0, zoom)
+  assert np.any(cropped)
+  assert np.array_equal(whole[window], cropped)
+  assert not np.any(np.delete(whole, np.s_[40:100], axis=0)) and not np.any(np.delete(whole, np.s_[30:90], axis=1))
+  with pytest.raises(ValueError):
+    visualization.highlight_shared_edges(np.zeros((50, 50, 3), dtype=np.uint8), 0, zoom)
@@ -0,0 +1,39 @@
+import os, glob, shutil, multiprocessing
+import pytest
+from monolayer_cell_tracking import parallel
+from monolayer_cell_tracking.trajectories import Trajectories
+from monolayer_cell_tracking.parallel import parallel_dump_data
+from benchmarks.synthetic import SyntheticMonolayer, SyntheticVisualization
+
+def dumped_files(trajectories):
+  files = sorted(glob.glob(os.path.join(trajectories.dump_dir(), 'ii=*.csv')))
+  return {os.path.basename(file): open(file).read() for file in files}
+
+def test_parallel_Yamada():
+  trajectories = Trajectories(
+    src='./monolayer_cell_tracking/data/Yamada.mp4',
+    model_path='./monolayer_cell_tracking/models/cellpose_segmentation_model_Yamada')
+
+  shutil.rmtree(trajectories.dump_dir())
+  trajectories.dump_data()
+  serial = dumped_files(trajectories)
+
+  shutil.rmtree(trajectories.dump_dir())
+  throughput = parallel_dump_data(trajectories, num_workers=4, shard_by='frames')
+  assert throughput
+  assert all(worker['frames'] > 0 for worker in throughput.values())
+  assert dumped_files(trajectories) == serial
+
+def test_parallel_spawned_workers(tmp_path, monkeypatch):
+  # Spawned workers construct their own copy of the (subclassed) object, which must keep the parent's settings.
+  monolayer = SyntheticMonolayer(num_cells=40, size=128, num_frames=4)
+  (src, model_path) = monolayer.write(str(tmp_path))
+  visualization = SyntheticVisualization(monolayer, src, model_path, frame_source='video')
+  visualization.dump_data()
+  serial = dumped_files(visualization)
+
+  shutil.rmtree(visualization.dump_dir())
+  monkeypatch.setattr(parallel, '_pool_context', lambda: multiprocessing.get_context('spawn'))
+  throughput = parallel_dump_data(visualization, num_workers=2, shard_by='cells')
+  assert throughput
+  assert dumped_files(visualization) == serial
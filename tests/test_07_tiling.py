@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from types import SimpleNamespace
+from scipy import ndimage
+from monolayer_cell_tracking.segmentation import segment_tiles
+from monolayer_cell_tracking.store import SegmentationStore
+from benchmarks.synthetic import SyntheticMonolayer
+
+def crop_model(diameter):
+  # Stands in for cellpose: the "frame" is the ground-truth mask itself, and each tile's labels are renumbered consecutively.
+  def evaluate(crop, channels, diameter):
+    (labels, inverse) = np.unique(crop, return_inverse=True)
+    return ((inverse.reshape(crop.shape) + (labels[0] != 0)).astype(np.uint16),)
+  return SimpleNamespace(diam_labels=np.array(diameter), eval=evaluate)
+
+def max_extent(masks):
+  # Largest distance (along either axis) from a cell's centroid to any of its pixels.
+  extent = 0.0
+  for label, window in enumerate(ndimage.find_objects(masks), 1):
+    if window is not None:
+      (yy, xx) = np.nonzero(masks[window] == label)
+      extent = max(extent, np.abs(yy - yy.mean()).max(), np.abs(xx - xx.mean()).max())
+  return extent
+
+def same_partition(masks_1, masks_2):
+  pairs = np.unique(np.c_[masks_1.ravel(), masks_2.ravel()], axis=0)
+  return len(pairs) == len(np.unique(masks_1)) == len(np.unique(masks_2))
+
+@pytest.mark.parametrize('tile_size', [160, 224])
+def test_segment_tiles_stitching(tile_size):
+  monolayer = SyntheticMonolayer(num_cells=400, size=500)
+  masks = monolayer.masks(0).astype(np.int64)
+  overlap = int(np.ceil(4 * max_extent(masks))) + 1
+  stitched = segment_tiles(crop_model(monolayer.cell_diameter()), masks, tile_size=tile_size, overlap=overlap)
+  assert stitched.dtype == np.uint32
+  assert same_partition(masks, stitched)
+
+def test_segment_tiles_single_tile():
+  monolayer = SyntheticMonolayer(num_cells=50, size=128)
+  masks = monolayer.masks(0).astype(np.int64)
+  assert same_partition(masks, segment_tiles(crop_model(monolayer.cell_diameter()), masks, tile_size=256, overlap=64))
+
+def test_store_wide_labels(tmp_path):
+  store = SegmentationStore(str(tmp_path / 'segmentations'))
+  store.create(2, (4, 4), np.uint32)
+  masks = np.full((4, 4), 70000, dtype=np.uint32)
+  store.write(1, masks)
+  reopened = SegmentationStore(str(tmp_path / 'segmentations'))
+  assert np.array_equal(reopened.read(1), masks)
+  assert reopened.dtype == np.uint32
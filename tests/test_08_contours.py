@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from monolayer_cell_tracking.contours import trace_outlines
+from benchmarks.synthetic import SyntheticMonolayer
+
+utils = pytest.importorskip('cellpose.utils')
+
+def handmade_masks():
+  masks = np.zeros((40, 48), dtype=np.uint16)
+  # A ring with a cell inside its hole, and a ring with an empty hole.
+  masks[2:16, 2:16] = 1
+  masks[5:13, 5:13] = 2
+  masks[7:11, 7:11] = 0
+  masks[2:14, 20:32] = 3
+  masks[5:11, 23:29] = 0
+  # A label split into two pieces (the longer outline is kept), and a cell too small to have an outline.
+  masks[20:26, 2:8] = 4
+  masks[30:38, 2:12] = 4
+  masks[20:22, 20:22] = 5
+  # Cells on each edge and in a corner of the frame, touching each other.
+  masks[0:10, 36:48] = 6
+  masks[10:40, 40:48] = 7
+  masks[34:40, 14:40] = 8
+  masks[18:30, 16:30] = 9
+  return masks
+
+def assert_same_outlines(masks):
+  contours = trace_outlines(masks)
+  labels = np.unique(masks)[1:]
+  assert list(contours) == labels.tolist()
+  for (label, outline) in zip(labels.tolist(), utils.outlines_list(masks, multiprocessing=False)):
+    outline = np.asarray(outline, dtype=np.int64).reshape(-1, 2)
+    assert np.array_equal(contours[label]['x'], outline[:, 0])
+    assert np.array_equal(contours[label]['y'], outline[:, 1])
+
+def test_outlines_handmade():
+  assert_same_outlines(handmade_masks())
+
+def test_outlines_without_background():
+  # Without any 0 pixels, the smallest label is taken to be the background.
+  masks = handmade_masks() + 1
+  assert_same_outlines(masks)
+  assert 1 not in trace_outlines(masks)
+
+def test_outlines_synthetic():
+  monolayer = SyntheticMonolayer(num_cells=100, size=256, num_frames=2)
+  for t in range(2):
+    assert_same_outlines(monolayer.masks(t))
+
+def test_outlines_empty():
+  assert len(trace_outlines(np.zeros((8, 8), dtype=np.uint16))) == 0
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from scipy.spatial import cKDTree
+from monolayer_cell_tracking.contours import trace_outlines
+from benchmarks.synthetic import SyntheticMonolayer, SyntheticVisualization
+
+@pytest.fixture(scope='module')
+def visualization(tmp_path_factory):
+  monolayer = SyntheticMonolayer(num_cells=100, size=256, num_frames=2)
+  (src, model_path) = monolayer.write(str(tmp_path_factory.mktemp('contacts')))
+  return SyntheticVisualization(monolayer, src, model_path)
+
+def contour_contacts(visualization, contours):
+  # The pairwise contour comparisons that the label adjacency pass replaced.
+  labels = list(contours)
+  contacts = {}
+  for (kk, label_1) in enumerate(labels):
+    for label_2 in labels[kk+1:]:
+      if visualization.are_neighbors(contours[label_1], contours[label_2]):
+        num_contact_pnts = visualization.shared_edge(contours[label_1], contours[label_2]).shape[0]
+        contacts.setdefault(label_1, {})[label_2] = contacts.setdefault(label_2, {})[label_1] = num_contact_pnts
+  return contacts
+
+def adjacency_contacts(visualization, masks):
+  contacts = {}
+  for (label_1, label_2, num_contact_pnts) in zip(*visualization.label_adjacency(masks)):
+    contacts.setdefault(int(label_1), {})[int(label_2)] = contacts.setdefault(int(label_2), {})[int(label_1)] = int(num_contact_pnts)
+  return contacts
+
+def test_contacts_synthetic(visualization):
+  # Synthetic cells are separated by a membrane of background, which both methods see across.
+  for t in range(visualization.monolayer.num_frames):
+    assert visualization.cell_contacts(t) == contour_contacts(visualization, visualization.cell_contours(t))
+
+def test_contacts_touching(visualization):
+  # Cells in direct contact (a Voronoi tessellation with no membranes, and one background pixel so that label 1 is a cell).
+  monolayer = visualization.monolayer
+  (yy, xx) = np.mgrid[0:monolayer.size, 0:monolayer.size]
+  (_, nearest) = cKDTree(monolayer.centers[0][:, ::-1]).query(np.c_[yy.ravel(), xx.ravel()])
+  masks = (nearest + 1).reshape(yy.shape).astype(np.uint16)
+  masks[0, 0] = 0
+
+  contacts = adjacency_contacts(visualization, masks)
+  expected = contour_contacts(visualization, trace_outlines(masks))
+  assert {label: set(neighbors) for label, neighbors in contacts.items()} == {label: set(neighbors) for label, neighbors in expected.items()}
+
+  # The outlines are 8-connected traces, which count a few more shared-edge points at staircase edges.
+  for (label_1, neighbors) in expected.items():
+    for (label_2, num_contact_pnts) in neighbors.items():
+      assert 0 <= num_contact_pnts - contacts[label_1][label_2] <= 0.1 * num_contact_pnts
+
+def test_contacts_no_neighbors(visualization):
+  masks = np.zeros((32, 32), dtype=np.uint16)
+  masks[2:10, 2:10] = 1
+  masks[20:30, 20:30] = 2
+  assert adjacency_contacts(visualization, masks) == contour_contacts(visualization, trace_outlines(masks)) == {}
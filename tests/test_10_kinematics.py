@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from types import SimpleNamespace
+from monolayer_cell_tracking.indexing import TrajectoryIndex
+from monolayer_cell_tracking.kinematics import correlations, velocities, nematic_order
+
+def tracklet(t, x, y, orientation=None):
+  orientation = np.zeros(len(t)) if isinstance(orientation, type(None)) else orientation
+  return SimpleNamespace(t=np.asarray(t), x=np.asarray(x, dtype=float), y=np.asarray(y, dtype=float), properties={'orientation': np.asarray(orientation, dtype=float)})
+
+def gapped_tracklets(num_cells=12, num_frames=30, seed=0):
+  # Random walks starting and ending at random times, each missing some of the frames in between.
+  rng = np.random.default_rng(seed)
+  tracklets = []
+  for _ in range(num_cells):
+    (start, stop) = np.sort(rng.choice(num_frames + 1, 2, replace=False))
+    t = np.arange(start, stop)
+    t = t[(rng.random(len(t)) < 0.8) | (t == start)]
+    tracklets.append(tracklet(t, np.cumsum(rng.normal(size=len(t))), np.cumsum(rng.normal(size=len(t)))))
+  tracklets.append(tracklet([num_frames - 1], [0.0], [0.0]))
+  return tracklets
+
+def brute_force_correlations(tracklets, max_lag):
+  # Average over every pair of observations (and of consecutive-frame velocities) `lag` frames apart.
+  sums = {name: np.zeros(max_lag) for name in ('msd', 'msd_pairs', 'vacf', 'vacf_pairs')}
+  for traj in tracklets:
+    r = {int(t): np.array([x, y]) for (t, x, y) in zip(traj.t, traj.x, traj.y)}
+    v = {t: r[t+1] - r[t] for t in r if t+1 in r}
+    for t1 in r:
+      for t2 in r:
+        if 0 <= t2 - t1 < max_lag:
+          sums['msd'][t2 - t1] += np.sum((r[t2] - r[t1])**2)
+          sums['msd_pairs'][t2 - t1] += 1
+    for t1 in v:
+      for t2 in v:
+        if 0 <= t2 - t1 < max_lag:
+          sums['vacf'][t2 - t1] += np.dot(v[t1], v[t2])
+          sums['vacf_pairs'][t2 - t1] += 1
+  with np.errstate(invalid='ignore'):
+    return {
+      'msd': sums['msd'] / sums['msd_pairs'], 'msd_pairs': sums['msd_pairs'],
+      'vacf': sums['vacf'] / sums['vacf_pairs'], 'vacf_pairs': sums['vacf_pairs']}
+
+@pytest.mark.parametrize('batch_size', [1, 5, 1024])
+def test_correlations(batch_size):
+  tracklets = gapped_tracklets()
+  index = TrajectoryIndex(tracklets)
+  table = correlations(index, batch_size=batch_size)
+  expected = brute_force_correlations(tracklets, index.num_frames())
+  assert np.array_equal(table['lag'], np.arange(index.num_frames()))
+  for name in ('msd_pairs', 'vacf_pairs'):
+    assert np.array_equal(table[name], expected[name])
+  for name in ('msd', 'vacf'):
+    np.testing.assert_allclose(table[name], expected[name], rtol=1e-9, atol=1e-9)
+
+def test_correlations_subset():
+  tracklets = gapped_tracklets(seed=1)
+  index = TrajectoryIndex(tracklets)
+  cells = np.array([0, 3, 4, 7])
+  table = correlations(index, cells, max_lag=10)
+  expected = brute_force_correlations([tracklets[ii] for ii in cells], 10)
+  assert np.array_equal(table['msd_pairs'], expected['msd_pairs'])
+  np.testing.assert_allclose(table['msd'], expected['msd'], rtol=1e-9, atol=1e-9)
+  np.testing.assert_allclose(table['vacf'], expected['vacf'], rtol=1e-9, atol=1e-9)
+
+def test_velocities_gap():
+  # Cell 1 is missing at frames 2 and 3, so its velocity at frame 4 is the displacement over 3 frames.
+  index = TrajectoryIndex([tracklet([3, 4], [0.0, 1.0], [0.0, 0.0]), tracklet([0, 1, 4], [0.0, 1.0, 7.0], [0.0, 0.0, 4.0])])
+  table = velocities(index)
+  assert table['ii'].tolist() == [0, 0, 1, 1, 1]
+  assert table['t'].tolist() == [3, 4, 0, 1, 4]
+  np.testing.assert_allclose(table['vx'], [np.nan, 1.0, np.nan, 1.0, 2.0])
+  np.testing.assert_allclose(table['vy'], [np.nan, 0.0, np.nan, 0.0, 4.0 / 3])
+  np.testing.assert_allclose(table['speed'], [np.nan, 1.0, np.nan, 1.0, np.hypot(2.0, 4.0 / 3)])
+
+def test_nematic_order():
+  # Aligned cells (with orientations a half-turn apart) are perfectly ordered, and perpendicular pairs cancel out.
+  index = TrajectoryIndex([
+    tracklet([0, 1, 2], [0, 0, 0], [0, 0, 0], [0.3, 0.0, np.nan]),
+    tracklet([0, 1, 2], [0, 0, 0], [0, 0, 0], [0.3 - np.pi, np.pi / 2, 0.5])])
+  table = nematic_order(index)
+  assert table['num_cells'].tolist() == [2, 2, 1]
+  np.testing.assert_allclose(table['nematic_order'], [1.0, 0.0, 1.0], atol=1e-12)
+  np.testing.assert_allclose(table['director'][[0, 2]], [0.3, 0.5])
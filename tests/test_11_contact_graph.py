@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from monolayer_cell_tracking.contacts import ContactGraph, load_contact_graph
+from benchmarks.synthetic import SyntheticMonolayer, SyntheticVisualization
+
+# Cells 0 and 1 (labels 1 and 2) are side by side between cells 2 and 3 (above and below), until they are pushed apart and cells 2 and 3 meet.
+(A, B, C, D) = (0, 1, 2, 3)
+
+def before_swap():
+  masks = np.zeros((20, 20), dtype=np.uint16)
+  masks[0:7] = C + 1
+  masks[13:20] = D + 1
+  masks[7:13, 0:10] = A + 1
+  masks[7:13, 10:20] = B + 1
+  return masks
+
+def after_swap():
+  masks = np.zeros((20, 20), dtype=np.uint16)
+  masks[:, 0:7] = A + 1
+  masks[:, 13:20] = B + 1
+  masks[0:10, 7:13] = C + 1
+  masks[10:20, 7:13] = D + 1
+  return masks
+
+@pytest.fixture(scope='module')
+def graph(tmp_path_factory):
+  monolayer = SyntheticMonolayer(num_cells=10, size=64, num_frames=1)
+  (src, model_path) = monolayer.write(str(tmp_path_factory.mktemp('contact_graph')))
+  visualization = SyntheticVisualization(monolayer, src, model_path)
+
+  # Each label is one tracklet, and a fifth cell (never in contact) exists throughout.
+  columns = {'t': [], 'ii': [], 'jj': [], 'num_contact_pnts': []}
+  for (t, masks) in enumerate([before_swap(), before_swap(), after_swap(), after_swap()]):
+    (label_1, label_2, num_contact_pnts) = visualization.label_adjacency(masks)
+    for (ii, jj) in ((label_1 - 1, label_2 - 1), (label_2 - 1, label_1 - 1)):
+      for name, value in (('t', np.full(len(ii), t)), ('ii', ii), ('jj', jj), ('num_contact_pnts', num_contact_pnts)):
+        columns[name].append(value)
+  return ContactGraph(*(np.concatenate(values) for values in columns.values()), num_frames=4, num_cells=5)
+
+def test_frame_contacts(graph):
+  assert graph.contacts(0, A) == {B: 12, C: 20, D: 20}
+  assert graph.contacts(3, C) == {A: 20, B: 20, D: 12}
+  assert graph.neighbors(2, A).tolist() == [C, D]
+  assert len(graph.neighbors(0, 4)) == 0
+  assert len(graph.frame_contacts(4)[0]) == 0
+
+def test_history(graph):
+  (t, jj, num_contact_pnts) = graph.history(A, 1, 2)
+  assert t.tolist() == [1, 1, 1, 2, 2]
+  assert jj.tolist() == [B, C, D, C, D]
+  assert num_contact_pnts.tolist() == [12, 20, 20, 20, 20]
+  assert graph.neighbors_between(A).tolist() == [B, C, D]
+  assert graph.neighbors_between(A, 2, 3).tolist() == [C, D]
+  assert graph.neighbors_between(4).tolist() == []
+
+def test_contact_frames(graph):
+  assert graph.contact_frames(A, B).tolist() == [0, 1]
+  assert graph.contact_frames(C, D).tolist() == [2, 3]
+  assert graph.contact_frames(A, C).tolist() == [0, 1, 2, 3]
+  assert graph.contact_frames(A, 4).tolist() == []
+
+def test_t1_events(graph):
+  assert graph.t1_events().tolist() == [[1, A, B, C, D]]
+  assert graph.t1_events(2).shape == (0, 5)
+  assert graph.t1_events(0, 1).shape == (0, 5)
+
+def test_save_load(graph, tmp_path):
+  graph.save(str(tmp_path / 'contacts.npz'))
+  loaded = load_contact_graph(str(tmp_path / 'contacts.npz'))
+  assert (loaded.num_frames, loaded.num_cells) == (graph.num_frames, graph.num_cells)
+  for name in ('t', 'ii', 'jj', 'num_contact_pnts', 'frame_start', 'cell_order', 'cell_start'):
+    assert np.array_equal(getattr(loaded, name), getattr(graph, name))